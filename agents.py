@@ -1,13 +1,28 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from tools import AccountTool, TransactionTool, CardTool
+from tools import AccountTool, TransactionTool, CardTool, MockBankingBackend, ToolCache, run_sync
 from rag_engine import BankRAG
+from cache import SemanticCache
+from context_builder import ContextAssembler
+from router import IntentRouter, INTENT_AGENTS
+from logger import audit_logger
+from metrics import annotate, timed, llm_metrics_callback
+from memory import SessionMemory
+from llm_transport import create_llm_http_clients
+
+def with_history(template):
+    """Agent prompt preceded by the session's recent conversation, if any"""
+    return ChatPromptTemplate.from_messages([
+        MessagesPlaceholder("history", optional=True),
+        ("human", template),
+    ])
 
 # Prompt Templates using modern ChatPromptTemplate
-account_prompt = ChatPromptTemplate.from_template(
+account_prompt = with_history(
     """You are a banking account specialist. Based on the tool result, provide a clear and professional response to the user's query.
 
 User Query: {query}
@@ -16,7 +31,7 @@ Tool Result: {tool_result}
 Response:"""
 )
 
-transaction_prompt = ChatPromptTemplate.from_template(
+transaction_prompt = with_history(
     """You are a banking transaction specialist. Based on the tool result, provide a clear and professional response to the user's query.
 
 User Query: {query}
@@ -25,7 +40,7 @@ Tool Result: {tool_result}
 Response:"""
 )
 
-card_prompt = ChatPromptTemplate.from_template(
+card_prompt = with_history(
     """You are a banking card services specialist. Based on the tool result, provide a clear and professional response to the user's query.
 
 User Query: {query}
@@ -34,6 +49,9 @@ Tool Result: {tool_result}
 Response:"""
 )
 
+# Bump whenever rag_prompt changes so cached RAG answers are not reused
+RAG_PROMPT_VERSION = 1
+
 rag_prompt = ChatPromptTemplate.from_template(
     """You are a banking policy expert. Based on the knowledge base information, provide a clear and professional response to the user's query.
 
@@ -45,124 +63,373 @@ Response:"""
 
 class Agent:
     """Base Agent class with LangChain LCEL Chain"""
-    def __init__(self, name, llm, prompt_template):
+    def __init__(self, name, llm, prompt_template, memory=None):
         self.name = name
         self.llm = llm
         self.prompt = prompt_template
         self.output_parser = StrOutputParser()
-        # Message history for conversation memory
-        self.message_history = ChatMessageHistory()
-        # Create chain using LCEL (LangChain Expression Language)
-        self.chain = self.prompt | self.llm | self.output_parser
+        # Per-session conversation memory, shared by all agents of an orchestrator
+        self.memory = memory if memory is not None else SessionMemory()
+        # Create chain using LCEL (LangChain Expression Language); the callback
+        # times prompt formatting and the LLM call and counts tokens
+        self.chain = (self.prompt | self.llm | self.output_parser).with_config(callbacks=[llm_metrics_callback])
+
+    async def arun_tool(self, query, intent=None):
+        """Call the agent's async banking tool for a query and return its result.
 
-    def process(self, query):
+        ``intent`` comes from the intent router; without it the agent falls
+        back to keyword matching on the query.
+        """
         raise NotImplementedError
 
-class AccountInfoAgent(Agent):
-    def __init__(self, llm):
-        super().__init__("AccountInfoAgent", llm, account_prompt)
-        self.tool = AccountTool()
+    def run_tool(self, query, intent=None):
+        """Blocking arun_tool; safe to call whether or not this thread runs an event loop"""
+        return run_sync(self.arun_tool(query, intent))
 
-    def process(self, query):
-        account_id = "123456789"
-        if "balance" in query.lower():
-            tool_result = self.tool.get_balance(account_id)
-        elif "details" in query.lower():
-            tool_result = self.tool.get_details(account_id)
-        else:
-            tool_result = "I can help with account balance and details."
+    def _chain_inputs(self, query, tool_result, history):
+        return {"query": query, "tool_result": str(tool_result), "history": history}
+
+    async def _achain_inputs(self, query, intent=None, session_id=None):
+        """Run the tool on the event loop while the session history loads in a thread"""
+        async def call_tool():
+            with timed("tool_call"):
+                return await self.arun_tool(query, intent)
+
+        tool_result, history = await asyncio.gather(
+            call_tool(), asyncio.to_thread(self.memory.history, session_id))
+        return self._chain_inputs(query, tool_result, history)
+
+    def process(self, query, intent=None, session_id=None):
+        with timed("tool_call"):
+            tool_result = self.run_tool(query, intent)
+        inputs = self._chain_inputs(query, tool_result, self.memory.history(session_id))
         # Use invoke with dict for LCEL chains
-        response = self.chain.invoke({"query": query, "tool_result": str(tool_result)})
-        # Save to message history
-        self.message_history.add_user_message(query)
-        self.message_history.add_ai_message(response)
+        response = self.chain.invoke(inputs)
+        self.memory.add_turn(session_id, query, response)
         return response
 
+    async def aprocess(self, query, intent=None, session_id=None):
+        """Async variant of process; only the history load and save run off the event loop"""
+        inputs = await self._achain_inputs(query, intent, session_id)
+        response = await self.chain.ainvoke(inputs)
+        await asyncio.to_thread(self.memory.add_turn, session_id, query, response)
+        return response
+
+    async def astream(self, query, intent=None, session_id=None):
+        """Yield response tokens as the LLM produces them"""
+        inputs = await self._achain_inputs(query, intent, session_id)
+        chunks = []
+        async for chunk in self.chain.astream(inputs):
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(self.memory.add_turn, session_id, query, "".join(chunks))
+
+class AccountInfoAgent(Agent):
+    def __init__(self, llm, memory=None, tool=None):
+        super().__init__("AccountInfoAgent", llm, account_prompt, memory)
+        self.tool = tool if tool is not None else AccountTool()
+
+    async def arun_tool(self, query, intent=None):
+        account_id = "123456789"
+        if intent == "account_balance" or (intent is None and "balance" in query.lower()):
+            return await self.tool.get_balance(account_id)
+        elif intent == "account_details" or (intent is None and "details" in query.lower()):
+            return await self.tool.get_details(account_id)
+        elif intent == "account_overview" or (intent is None and ("overview" in query.lower() or "summary" in query.lower())):
+            return await self.tool.get_overview(account_id)
+        return "I can help with account balance and details."
+
 class TransactionAgent(Agent):
-    def __init__(self, llm):
-        super().__init__("TransactionAgent", llm, transaction_prompt)
-        self.tool = TransactionTool()
+    def __init__(self, llm, memory=None, tool=None):
+        super().__init__("TransactionAgent", llm, transaction_prompt, memory)
+        self.tool = tool if tool is not None else TransactionTool()
 
-    def process(self, query):
+    async def arun_tool(self, query, intent=None):
         account_id = "123456789"
-        if "recent" in query.lower() or "transactions" in query.lower():
-            tool_result = self.tool.get_recent_transactions(account_id)
-        elif "transfer" in query.lower():
+        if intent == "recent_transactions" or (intent is None and ("recent" in query.lower() or "transactions" in query.lower())):
+            return await self.tool.get_recent_transactions(account_id)
+        elif intent == "transfer_funds" or (intent is None and "transfer" in query.lower()):
             amount = 100
             target = "987654321"
-            tool_result = self.tool.transfer_funds(account_id, target, amount)
-        else:
-            tool_result = "I can help with transactions and transfers."
-        # Use invoke with dict for LCEL chains
-        response = self.chain.invoke({"query": query, "tool_result": str(tool_result)})
-        # Save to message history
-        self.message_history.add_user_message(query)
-        self.message_history.add_ai_message(response)
-        return response
+            audit_logger.log_action("TRANSFER_FUNDS", {"source": account_id, "target": target, "amount": amount})
+            return await self.tool.transfer_funds(account_id, target, amount)
+        return "I can help with transactions and transfers."
 
 class CardServicesAgent(Agent):
-    def __init__(self, llm):
-        super().__init__("CardServicesAgent", llm, card_prompt)
-        self.tool = CardTool()
+    def __init__(self, llm, memory=None, tool=None):
+        super().__init__("CardServicesAgent", llm, card_prompt, memory)
+        self.tool = tool if tool is not None else CardTool()
 
-    def process(self, query):
+    async def arun_tool(self, query, intent=None):
         card_last4 = "4321"
-        if "block" in query.lower():
-            tool_result = self.tool.block_card(card_last4)
-        elif "replace" in query.lower() or "lost" in query.lower():
-            tool_result = self.tool.request_replacement(card_last4)
-        else:
-            tool_result = "I can help with card blocking and replacement."
-        # Use invoke with dict for LCEL chains
-        response = self.chain.invoke({"query": query, "tool_result": str(tool_result)})
-        # Save to message history
-        self.message_history.add_user_message(query)
-        self.message_history.add_ai_message(response)
-        return response
+        if intent == "block_card" or (intent is None and "block" in query.lower()):
+            audit_logger.log_action("BLOCK_CARD", {"card_last4": card_last4})
+            return await self.tool.block_card(card_last4)
+        elif intent == "replace_card" or (intent is None and ("replace" in query.lower() or "lost" in query.lower())):
+            return await self.tool.request_replacement(card_last4)
+        return "I can help with card blocking and replacement."
 
 class Orchestrator:
-    def __init__(self, rag_engine: BankRAG, api_key):
+    def __init__(self, rag_engine: BankRAG, api_key, answer_cache_size=512, answer_cache_threshold=0.95,
+                 llm=None, blocking_workers=4, router="embedding", session_memory=None,
+                 context_max_tokens=1500, context_dedup_threshold=0.92, llm_http_clients=None,
+                 banking_backend=None, tool_cache=None, write_intent_confidence=0.55):
         self.rag = rag_engine
-        # Initialize LangChain LLM
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            openai_api_key=api_key,
-            temperature=0.7
-        )
-        # Initialize agents with LLM
-        self.account_agent = AccountInfoAgent(self.llm)
-        self.transaction_agent = TransactionAgent(self.llm)
-        self.card_agent = CardServicesAgent(self.llm)
+        # Initialize LangChain LLM (callers may pass any chat model, e.g. a local stub)
+        if llm is None:
+            # Pooled connections, deadlines, retries, hedging and the circuit breaker live
+            # in the httpx transport, so the SDK's own retries are turned off
+            from langchain_openai import ChatOpenAI
+            http_client, http_async_client = llm_http_clients or create_llm_http_clients()
+            llm = ChatOpenAI(
+                model="gpt-3.5-turbo",
+                openai_api_key=api_key,
+                temperature=0.7,
+                # Report token usage on streamed responses too
+                stream_usage=True,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                timeout=http_async_client.timeout,
+                max_retries=0
+            )
+        self.llm = llm
+        # Initialize agents with LLM and shared session memory
+        self.session_memory = session_memory if session_memory is not None else SessionMemory()
+        # Agents share one banking backend and read-through cache, so a transfer or card
+        # block invalidates what the other agents have cached for that account
+        self.banking_backend = banking_backend if banking_backend is not None else MockBankingBackend()
+        self.tool_cache = tool_cache if tool_cache is not None else ToolCache()
+        self.account_agent = AccountInfoAgent(self.llm, self.session_memory,
+                                              AccountTool(self.banking_backend, self.tool_cache))
+        self.transaction_agent = TransactionAgent(self.llm, self.session_memory,
+                                                  TransactionTool(self.banking_backend, self.tool_cache))
+        self.card_agent = CardServicesAgent(self.llm, self.session_memory,
+                                            CardTool(self.banking_backend, self.tool_cache))
+        self._agents = {None: None, "account": self.account_agent,
+                        "transaction": self.transaction_agent, "card": self.card_agent}
+        # Embedding intent router on the already-loaded encoder; "keyword" keeps the legacy rules.
+        # Transfers and card actions need a closer match than read-only lookups
+        self.intent_router = IntentRouter(self.rag.encoder, write_confidence=write_intent_confidence) \
+            if router == "embedding" else None
         # RAG chain using LCEL
         output_parser = StrOutputParser()
-        self.rag_chain = rag_prompt | self.llm | output_parser
+        self.rag_chain = (rag_prompt | self.llm | output_parser).with_config(callbacks=[llm_metrics_callback])
+        # Merges overlapping chunks, drops near-duplicates and fits the context into a token budget
+        self.context_assembler = ContextAssembler(self.rag.encoder, max_tokens=context_max_tokens,
+                                                  dedup_threshold=context_dedup_threshold)
+        # Semantic cache for the stateless RAG chain only; tool-backed agent
+        # answers depend on live account data and are never cached
+        self.answer_cache = SemanticCache(maxsize=answer_cache_size, threshold=answer_cache_threshold)
+        self._answer_cache_index_version = self.rag.index_version
+        # Query encoding and Milvus search block, so the async path runs them here
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="orchestrator")
         print("[Orchestrator] LangChain-powered agents initialized successfully")
 
+    async def _run_blocking(self, func, *args):
+        # Copy the context so the request's trace follows the call into the pool
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, func, *args)
+
     def _process_rag_query(self, query, context):
         """Process RAG query with LLM Chain"""
         response = self.rag_chain.invoke({"query": query, "context": context})
         return response
 
-    def route_query(self, query):
-        """Route query to appropriate agent chain"""
+    def _cached_answer(self, query, hits):
+        """Check the semantic cache for retrieved hits; returns (cache_key, query_vector, cached_response)"""
+        if self.rag.index_version != self._answer_cache_index_version:
+            self.answer_cache.clear()
+            self._answer_cache_index_version = self.rag.index_version
+        audit_logger.log_rag_retrieval(query, [os.path.basename(hit["source"]) for hit in hits])
+        cache_key = (tuple(hit["id"] for hit in hits), RAG_PROMPT_VERSION)
+        query_vector = self.rag.embed_query(query)
+        response = self.answer_cache.get(cache_key, query, query_vector)
+        if response is not None:
+            print("[Orchestrator] Answered from semantic cache")
+        return cache_key, query_vector, response
+
+    @staticmethod
+    def _log_context(report):
+        print(f"[Orchestrator] Context {report['retrieved_tokens']} -> {report['context_tokens']} tokens "
+              f"({report['merged']} merged, {report['deduplicated']} duplicates dropped)")
+
+    def _lookup_answer(self, query, hits=None):
+        """Retrieve chunks (unless given) and check the semantic cache.
+
+        Returns (context, cache_key, query_vector, cached_response); the
+        context is only assembled when there is no cached response.
+        """
+        if hits is None:
+            hits = self.rag.retrieve_chunks(query)
+        cache_key, query_vector, response = self._cached_answer(query, hits)
+        if response is not None:
+            return None, cache_key, query_vector, response
+        context, report = self.context_assembler.assemble(hits)
+        self._log_context(report)
+        return context, cache_key, query_vector, None
+
+    def _answer_from_knowledge_base(self, query):
+        """Retrieve context and answer with the RAG chain, reusing cached answers"""
+        context, cache_key, query_vector, response = self._lookup_answer(query)
+        if response is not None:
+            return response
+        response = self._process_rag_query(query, context)
+        self.answer_cache.set(cache_key, query, query_vector, response)
+        return response
+
+    async def _aanswer_from_knowledge_base(self, query):
+        context, cache_key, query_vector, response = await self._run_blocking(self._lookup_answer, query)
+        if response is not None:
+            return response
+        response = await self.rag_chain.ainvoke({"query": query, "context": context})
+        self.answer_cache.set(cache_key, query, query_vector, response)
+        return response
+
+    async def _astream_from_knowledge_base(self, query):
+        context, cache_key, query_vector, response = await self._run_blocking(self._lookup_answer, query)
+        if response is not None:
+            yield response
+            return
+        chunks = []
+        async for chunk in self.rag_chain.astream({"query": query, "context": context}):
+            chunks.append(chunk)
+            yield chunk
+        self.answer_cache.set(cache_key, query, query_vector, "".join(chunks))
+
+    def _lookup_answers(self, queries):
+        """_lookup_answer for many queries: batched embedding, one Milvus search and one context assembly"""
+        hits_per_query = self.rag.retrieve_chunks_batch(queries)
+        checks = [self._cached_answer(query, hits) for query, hits in zip(queries, hits_per_query)]
+        misses = [i for i, (_, _, response) in enumerate(checks) if response is None]
+        contexts = {}
+        for i, (context, report) in zip(misses, self.context_assembler.assemble_many(
+                [hits_per_query[i] for i in misses])):
+            self._log_context(report)
+            contexts[i] = context
+        return [(contexts.get(i), *check) for i, check in enumerate(checks)]
+
+    def _keyword_route(self, query):
+        """Keyword routing; returns (agent, intent) with agent None for the knowledge base"""
         query_lower = query.lower()
         # Check for policy/info questions (RAG)
         rag_keywords = ["fee", "cost", "charge", "requirement", "document", "id", "dispute", "policy", "process", "how to", "what is"]
         if any(k in query_lower for k in rag_keywords) and not any(k in query_lower for k in ["my account", "my card", "transfer", "block"]):
             print(f"[Orchestrator] Routing to RAG Chain...")
-            context = self.rag.retrieve(query)
-            return self._process_rag_query(query, context)
+            return None, "knowledge_base"
         # Route to specific agent chains
         if "account" in query_lower or "balance" in query_lower:
             print(f"[Orchestrator] Routing to AccountInfoAgent Chain...")
-            return self.account_agent.process(query)
+            return self.account_agent, None
         if "transfer" in query_lower or "transaction" in query_lower or "sent" in query_lower or "received" in query_lower:
             print(f"[Orchestrator] Routing to TransactionAgent Chain...")
-            return self.transaction_agent.process(query)
+            return self.transaction_agent, None
         if "card" in query_lower or "block" in query_lower or "lost" in query_lower:
             print(f"[Orchestrator] Routing to CardServicesAgent Chain...")
-            return self.card_agent.process(query)
+            return self.card_agent, None
         # Fallback to RAG chain
         print(f"[Orchestrator] Unsure of intent, checking Knowledge Base Chain...")
-        context = self.rag.retrieve(query)
-        return self._process_rag_query(query, context)
+        return None, "knowledge_base"
+
+    def _route(self, query):
+        """Pick the agent and intent for a query; agent None is the knowledge base"""
+        with timed("routing"):
+            agent, intent = self._select_route(query)
+        annotate("intent", intent or agent.name)
+        return agent, intent
+
+    def _select_route(self, query):
+        if self.intent_router is None:
+            agent, intent = self._keyword_route(query)
+            audit_logger.log_query(intent or agent.name, query)
+            return agent, intent
+        # The query embedding is cached, so RAG retrieval reuses it
+        intent, confidence = self.intent_router.classify_vector(self.rag.embed_query(query))
+        agent = self._agents[INTENT_AGENTS[intent]]
+        print(f"[Orchestrator] Routing to {agent.name if agent else 'RAG'} Chain "
+              f"(intent={intent}, confidence={confidence:.2f})...")
+        audit_logger.log_query(intent, query)
+        return agent, intent
+
+    def _route_batch(self, queries):
+        """_route for many queries, embedding them all in one encoder call"""
+        with timed("routing"):
+            if self.intent_router is None:
+                routes = [self._select_route(query) for query in queries]
+            else:
+                routes = []
+                for query, vector in zip(queries, self.rag.embed_queries(queries)):
+                    intent, _ = self.intent_router.classify_vector(vector)
+                    audit_logger.log_query(intent, query)
+                    routes.append((self._agents[INTENT_AGENTS[intent]], intent))
+        print(f"[Orchestrator] Routed {len(queries)} batch queries "
+              f"({sum(agent is None for agent, _ in routes)} to RAG)")
+        return routes
+
+    def route_query(self, query, session_id=None):
+        """Route query to appropriate agent chain.
+
+        Agent answers see and extend the session's history; the knowledge
+        base chain is stateless.
+        """
+        agent, intent = self._route(query)
+        if agent is None:
+            return self._answer_from_knowledge_base(query)
+        return agent.process(query, intent, session_id)
+
+    async def aroute_query(self, query, session_id=None):
+        """Async route_query: LLM calls use ainvoke and blocking work runs in an executor"""
+        agent, intent = await self._run_blocking(self._route, query)
+        if agent is None:
+            return await self._aanswer_from_knowledge_base(query)
+        return await agent.aprocess(query, intent, session_id)
+
+    async def abatch_queries(self, queries, session_ids=None, concurrency=8):
+        """Answer many queries, yielding (index, response, error) in input order.
+
+        Routing and retrieval are batched (one encoder call, one multi-vector
+        search); LLM calls then run with at most ``concurrency`` in flight.
+        A failing item yields its exception instead of stopping the batch.
+        """
+        session_ids = session_ids or [None] * len(queries)
+        routes = await self._run_blocking(self._route_batch, queries)
+        rag_indices = [i for i, (agent, _) in enumerate(routes) if agent is None]
+        try:
+            lookups = await self._run_blocking(self._lookup_answers, [queries[i] for i in rag_indices])
+        except Exception as e:
+            lookups = [e] * len(rag_indices)
+        lookup_for = dict(zip(rag_indices, lookups))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(i):
+            agent, intent = routes[i]
+            async with semaphore:
+                if agent is not None:
+                    return await agent.aprocess(queries[i], intent, session_ids[i])
+                lookup = lookup_for[i]
+                if isinstance(lookup, Exception):
+                    raise lookup
+                context, cache_key, query_vector, response = lookup
+                if response is None:
+                    response = await self.rag_chain.ainvoke({"query": queries[i], "context": context})
+                    self.answer_cache.set(cache_key, queries[i], query_vector, response)
+                return response
+
+        tasks = [asyncio.ensure_future(answer(i)) for i in range(len(queries))]
+        try:
+            for i, task in enumerate(tasks):
+                try:
+                    yield i, await task, None
+                except Exception as e:
+                    yield i, None, e
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream_query(self, query, session_id=None):
+        """Streaming aroute_query: yields response tokens as they are generated"""
+        agent, intent = await self._run_blocking(self._route, query)
+        stream = self._astream_from_knowledge_base(query) if agent is None else agent.astream(query, intent, session_id)
+        async for token in stream:
+            # Usage-only and role chunks carry no text; they are not a first token
+            if token:
+                yield token
@@ -0,0 +1,982 @@
+"""Benchmarks for the Banking AI Assistant.
+
+Every benchmark runs offline against StubChatModel and prints a JSON report.
+
+    python benchmark.py load --requests 100 --concurrency 16 --latency 0.5
+    python benchmark.py routing
+    python benchmark.py audit --records 20000
+    python benchmark.py retrieval --top-k 1 3
+    python benchmark.py retrieval --corpus data/corpus --ingest-workers 4 --repeat 1
+    python benchmark.py transport --slow-rate 0.05 --failure-rate 0.05 --hedge-after 0.5
+    python benchmark.py startup --repeat 5
+    python benchmark.py workers --uri http://localhost:19530 --workers 2
+    python benchmark.py encoders --backends torch onnx onnx-int8 --threads 4
+    python benchmark.py encoders --corpus data/corpus --repeat 1
+    python benchmark.py stores --chunks 20000
+    python benchmark.py tools --latency 0.05 --concurrency 50
+    python benchmark.py --output replay.json replay --corpus queries.jsonl --concurrency 8
+
+Pass --output to also write the report to a file for regression tracking.
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import glob
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import httpx
+import numpy as np
+from rag_engine import BankRAG, load_and_split
+from agents import Orchestrator
+from router import IntentRouter, INTENT_AGENTS
+from stub_llm import StubChatModel, create_stub_openai_app
+from llm_transport import create_llm_http_clients
+from flat_index import FlatVectorStore
+from tools import MockBankingBackend, ToolCache, AccountTool, TransactionTool, CardTool
+from logger import AuditLogger
+from metrics import Trace, current_trace
+
+DATA_FILES = ["data/fee_schedule.pdf", "data/KYC_requirements.pdf", "data/dispute_process.pdf"]
+BENCH_DB_FILE = "./bench_milvus.db"
+
+LOAD_QUERIES = [
+    "What is the fee for an international wire transfer?",
+    "What is my current account balance?",
+    "How do I dispute a transaction and how long does it take?",
+    "I lost my card, please block it immediately.",
+    "Show me my recent transactions.",
+]
+
+
+# Held-out labelled queries (not router exemplars) for routing accuracy
+ROUTING_QUERIES = [
+    ("What is the fee for an international wire transfer?", "knowledge_base"),
+    ("How do I dispute a transaction and how long does it take?", "knowledge_base"),
+    ("Which ID did you accept for opening an account?", "knowledge_base"),
+    ("What do I need to provide for KYC on a business account?", "knowledge_base"),
+    ("Do you charge for using another bank's ATM?", "knowledge_base"),
+    ("How long do I have to report an error on my statement?", "knowledge_base"),
+    ("What is my current account balance?", "account_balance"),
+    ("How much cash is left in my account?", "account_balance"),
+    ("Tell me the details of my account", "account_details"),
+    ("What status is my account in?", "account_details"),
+    ("Can I get a summary of everything on my account?", "account_overview"),
+    ("Give me a rundown of my account: balance, status and latest activity", "account_overview"),
+    ("Show me my recent transactions.", "recent_transactions"),
+    ("Which payments did I make last week?", "recent_transactions"),
+    ("Did I get paid this week?", "recent_transactions"),
+    ("Transfer 100 dollars to account 987654321", "transfer_funds"),
+    ("Please send $250 to my brother's account", "transfer_funds"),
+    ("I lost my card, please block it immediately.", "block_card"),
+    ("My wallet was stolen, freeze my card", "block_card"),
+    ("Can you send me a replacement for my broken card?", "replace_card"),
+    ("I need a new debit card", "replace_card"),
+]
+
+# Labelled retrieval queries over the data_gen.py corpus: (query, source PDF, text the
+# relevant chunk must contain). Exact fee names and codes are where vector search is weakest.
+RETRIEVAL_QUERIES = [
+    ("ATM Fee (Non-Network)", "fee_schedule.pdf", "$2.50"),
+    ("What is the overdraft fee?", "fee_schedule.pdf", "$35.00"),
+    ("Monthly Maintenance Fee waiver balance", "fee_schedule.pdf", "$1,500"),
+    ("Excessive Withdrawal Fee on savings", "fee_schedule.pdf", "$5.00"),
+    ("International Outgoing wire fee", "fee_schedule.pdf", "$45.00"),
+    ("Domestic Incoming wire", "fee_schedule.pdf", "$15.00"),
+    ("EIN", "KYC_requirements.pdf", "Employer Identification Number"),
+    ("Can I use an ITIN instead of an SSN?", "KYC_requirements.pdf", "ITIN"),
+    ("Articles of Incorporation", "KYC_requirements.pdf", "Articles of Incorporation"),
+    ("How recent must my proof of address be?", "KYC_requirements.pdf", "60 days"),
+    ("Beneficial Ownership Information for business accounts", "KYC_requirements.pdf", "Beneficial Ownership"),
+    ("When do I get provisional credit?", "dispute_process.pdf", "10 business days"),
+    ("How long does a dispute investigation take?", "dispute_process.pdf", "45-90 days"),
+    ("Deadline to notify the bank of a statement error", "dispute_process.pdf", "60 days"),
+]
+
+
+def percentiles(samples):
+    """p50/p95/p99 of a list of seconds, in milliseconds"""
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def build_orchestrator(latency, tokens_per_sec=0.0, answer_cache_size=0):
+    """Orchestrator over the demo corpus with a stub LLM (answer cache off by default)"""
+    rag = BankRAG(db_file=BENCH_DB_FILE)
+    rag.ingest_docs(DATA_FILES)
+    llm = StubChatModel(latency=latency, tokens_per_sec=tokens_per_sec)
+    return Orchestrator(rag, api_key=None, llm=llm, answer_cache_size=answer_cache_size)
+
+
+def load_corpus(path):
+    """Queries from a JSONL file ("query", or "title" + "body" fields) or one query per line"""
+    if not path:
+        return LOAD_QUERIES + [query for query, _ in ROUTING_QUERIES]
+    queries = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                query = record.get("query") or " ".join(filter(None, [record.get("title"), record.get("body")]))
+            else:
+                query = line
+            queries.append(query)
+    return queries
+
+
+async def run_concurrently(call, queries, concurrency):
+    """Run ``await call(query)`` for every query with at most ``concurrency`` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            await call(query)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return time.perf_counter() - start
+
+
+def bench_load(args):
+    """Compare the blocking route_query path with aroute_query under concurrency"""
+    orchestrator = build_orchestrator(args.latency)
+    queries = [LOAD_QUERIES[i % len(LOAD_QUERIES)] for i in range(args.requests)]
+
+    async def blocking(query):
+        # What /api/ask did before: a synchronous call inside the event loop
+        orchestrator.route_query(query)
+
+    results = {}
+    for name, call in (("sync", blocking), ("async", orchestrator.aroute_query)):
+        elapsed = asyncio.run(run_concurrently(call, queries, args.concurrency))
+        results[name] = {"seconds": round(elapsed, 3), "requests_per_sec": round(len(queries) / elapsed, 2)}
+    results["speedup"] = round(results["sync"]["seconds"] / results["async"]["seconds"], 2)
+    return {
+        "benchmark": "load",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency": args.latency,
+        "results": results,
+    }
+
+
+def bench_routing(args):
+    """Accuracy and latency of the embedding intent router vs the keyword router"""
+    orchestrator = build_orchestrator(latency=0.0)
+    router = orchestrator.intent_router or IntentRouter(orchestrator.rag.encoder)
+    agent_names = {agent: name for name, agent in orchestrator._agents.items()}
+
+    queries = load_routing_queries(args.queries)
+    keyword = {"correct": 0, "latency": []}
+    embedding = {"correct": 0, "intent_correct": 0, "latency": [], "classify_latency": []}
+    for _ in range(args.repeat):
+        for query, intent in queries:
+            expected_agent = INTENT_AGENTS[intent]
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                agent, _ = orchestrator._keyword_route(query)
+                keyword["latency"].append(time.perf_counter() - start)
+            keyword["correct"] += agent_names[agent] == expected_agent
+
+            # Embedding cost is measured uncached; classification on its own too
+            start = time.perf_counter()
+            vector = orchestrator.rag.encoder.encode(query)
+            classify_start = time.perf_counter()
+            predicted, _ = router.classify_vector(vector)
+            end = time.perf_counter()
+            embedding["latency"].append(end - start)
+            embedding["classify_latency"].append(end - classify_start)
+            embedding["correct"] += INTENT_AGENTS[predicted] == expected_agent
+            embedding["intent_correct"] += predicted == intent
+
+    total = len(queries) * args.repeat
+    return {
+        "benchmark": "routing",
+        "queries": len(queries),
+        "repeat": args.repeat,
+        "keyword": {
+            "agent_accuracy": round(keyword["correct"] / total, 3),
+            "latency": percentiles(keyword["latency"]),
+        },
+        "embedding": {
+            "agent_accuracy": round(embedding["correct"] / total, 3),
+            "intent_accuracy": round(embedding["intent_correct"] / total, 3),
+            "classify_latency": percentiles(embedding["classify_latency"]),
+            "encode_and_classify_latency": percentiles(embedding["latency"]),
+            "mean_classify_ms": round(statistics.mean(embedding["classify_latency"]) * 1000, 4),
+        },
+    }
+
+
+def bench_audit(args):
+    """Per-call overhead of audit logging: synchronous FileHandler vs queued AuditLogger"""
+    query = "How do I dispute a transaction and how long does it take? " * 2
+    sources = ["dispute_process.pdf", "fee_schedule.pdf", "KYC_requirements.pdf"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The previous implementation: f-string + FileHandler on the request thread
+        sync_logger = logging.getLogger("AuditBenchSync")
+        sync_logger.propagate = False
+        handler = logging.FileHandler(os.path.join(tmp, "sync.log"))
+        handler.setFormatter(logging.Formatter('%(asctime)s - AUDIT - %(message)s'))
+        sync_logger.addHandler(handler)
+        sync_logger.setLevel(logging.INFO)
+
+        sync_latency = []
+        for _ in range(args.records):
+            start = time.perf_counter()
+            sync_logger.info(f"RAG_RETRIEVAL | User: anonymous | Query: {query} | Sources: {sources}")
+            sync_latency.append(time.perf_counter() - start)
+        handler.close()
+        sync_logger.removeHandler(handler)
+
+        results = {"sync_file_handler": {"latency": percentiles(sync_latency),
+                                         "mean_us": round(statistics.mean(sync_latency) * 1e6, 2)}}
+        for durability in ("os", "interval", "sync"):
+            audit = AuditLogger(os.path.join(tmp, f"{durability}.log"), durability=durability)
+            latency = []
+            for _ in range(args.records):
+                start = time.perf_counter()
+                audit.log_rag_retrieval(query, sources)
+                latency.append(time.perf_counter() - start)
+            drain_start = time.perf_counter()
+            audit.close()
+            results[f"queued_{durability}"] = {
+                "latency": percentiles(latency),
+                "mean_us": round(statistics.mean(latency) * 1e6, 2),
+                "drain_seconds": round(time.perf_counter() - drain_start, 3),
+                **audit.stats(),
+            }
+
+    return {"benchmark": "audit", "records": args.records, "results": results}
+
+
+def load_labelled_queries(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_retrieval_queries(path):
+    """(query, source, answer) triples from a JSONL file, or the built-in set.
+
+    Records without a source (e.g. tool queries in a data_gen.py query set) are skipped.
+    """
+    if not path:
+        return RETRIEVAL_QUERIES
+    return [(r["query"], r["source"], r["answer"]) for r in load_labelled_queries(path) if r.get("source")]
+
+
+def load_routing_queries(path):
+    """(query, intent) pairs from a JSONL file, or the built-in set"""
+    if not path:
+        return ROUTING_QUERIES
+    return [(r["query"], r["intent"]) for r in load_labelled_queries(path)]
+
+
+def _is_relevant(hit, source, answer):
+    return os.path.basename(hit["source"]) == source and answer.lower() in hit["text"].lower()
+
+
+def bench_retrieval(args):
+    """Recall@k and latency of vector-only vs hybrid (vector + BM25) retrieval.
+
+    With --corpus, every PDF of a data_gen.py corpus is ingested (timed) and
+    its queries.jsonl is the default query set.
+    """
+    files = sorted(glob.glob(os.path.join(args.corpus, "*.pdf"))) if args.corpus else DATA_FILES
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Caches off so every query pays for embedding and search
+        rag = BankRAG(db_file=BENCH_DB_FILE, query_cache_size=0, retrieval_mode="hybrid",
+                      hybrid_candidates=args.candidates, ingest_workers=args.ingest_workers)
+        start = time.perf_counter()
+        rag.ingest_docs(files)
+        ingest_seconds = time.perf_counter() - start
+    queries_file = args.queries or (os.path.join(args.corpus, "queries.jsonl") if args.corpus else None)
+    queries = load_retrieval_queries(queries_file)
+    modes = {
+        "vector": lambda query, k: rag._vector_search(query, k),
+        "hybrid": lambda query, k: rag.retrieve_chunks(query, k),
+    }
+
+    results = {}
+    for mode, search in modes.items():
+        for k in args.top_k:
+            found, latency = 0, []
+            for _ in range(args.repeat):
+                for query, source, answer in queries:
+                    start = time.perf_counter()
+                    hits = search(query, k)
+                    latency.append(time.perf_counter() - start)
+                    found += any(_is_relevant(hit, source, answer) for hit in hits)
+            results.setdefault(mode, {})[f"top_{k}"] = {
+                "recall": round(found / (len(queries) * args.repeat), 3),
+                "latency": percentiles(latency),
+            }
+    return {
+        "benchmark": "retrieval",
+        "queries": len(queries),
+        "repeat": args.repeat,
+        "documents": len(files),
+        "indexed_chunks": len(rag.lexical_index),
+        "ingest_seconds": round(ingest_seconds, 3),
+        "ingest_chunks_per_sec": round(len(rag.lexical_index) / ingest_seconds, 1) if ingest_seconds else None,
+        "hybrid_candidates": args.candidates,
+        "results": results,
+    }
+
+
+def summarize_traces(traces, elapsed, errors):
+    """Throughput, per-stage percentiles and routing distribution from request traces"""
+    stages = {}
+    for trace in traces:
+        for stage, ms in trace["stages_ms"].items():
+            stages.setdefault(stage, []).append(ms / 1000)
+    return {
+        "requests": len(traces) + errors,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round((len(traces) + errors) / elapsed, 2) if elapsed else None,
+        "latency": percentiles([trace["total_seconds"] for trace in traces]),
+        "stages": {stage: percentiles(samples) for stage, samples in sorted(stages.items())},
+        "tokens": {
+            "prompt": sum(trace["tokens"]["prompt"] for trace in traces),
+            "completion": sum(trace["tokens"]["completion"] for trace in traces),
+        },
+        "routing": dict(Counter(trace.get("intent", "unknown") for trace in traces).most_common()),
+    }
+
+
+def replay_orchestrator(orchestrator, queries, concurrency):
+    """Replay queries through the synchronous route_query from a thread pool"""
+    def one(query):
+        trace = Trace()
+        current_trace.set(trace)
+        start = time.perf_counter()
+        orchestrator.route_query(query)
+        return {**trace.to_dict(), "total_seconds": time.perf_counter() - start}
+
+    traces, errors = [], 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # A fresh context per request keeps traces from leaking between requests
+        futures = [pool.submit(contextvars.copy_context().run, one, q) for q in queries]
+        for future in futures:
+            try:
+                traces.append(future.result())
+            except Exception:
+                errors += 1
+    return summarize_traces(traces, time.perf_counter() - start, errors)
+
+
+async def replay_api(orchestrator, queries, concurrency):
+    """Replay queries through POST /api/ask in-process, with tracing enabled"""
+    import main as api
+
+    api.orchestrator = orchestrator
+    traces, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        async def one(query):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/ask", json={"query": query, "trace": True})
+                if response.status_code != 200:
+                    errors += 1
+                    return
+                traces.append({**response.json()["trace"], "total_seconds": time.perf_counter() - start})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in queries))
+    return summarize_traces(traces, time.perf_counter() - start, errors)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(app):
+    """Serve app on a free local port in a background thread; returns (server, base URL)"""
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}/v1"
+
+
+def bench_transport(args):
+    """ChatOpenAI with SDK defaults vs the resilient transport, against a stub server
+    that injects slow and failing responses"""
+    from langchain_openai import ChatOpenAI
+
+    app = create_stub_openai_app(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                                 failure_rate=args.failure_rate, seed=0)
+    server, base_url = start_stub_server(app)
+
+    def sdk_default():
+        return ChatOpenAI(model="stub", api_key="stub", base_url=base_url, timeout=args.deadline,
+                          max_retries=args.retries)
+
+    def resilient():
+        http_client, http_async_client = create_llm_http_clients(
+            deadline=args.deadline, max_retries=args.retries, hedge_after=args.hedge_after or None,
+            max_in_flight=args.concurrency)
+        return ChatOpenAI(model="stub", api_key="stub", base_url=base_url, http_client=http_client,
+                          http_async_client=http_async_client, timeout=http_async_client.timeout, max_retries=0)
+
+    async def run(llm):
+        latency, errors = [], 0
+
+        async def one(prompt):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                await llm.ainvoke(prompt)
+                latency.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+        upstream_before = app.state.stats["requests"]
+        prompts = [f"What is fee number {i}?" for i in range(args.requests)]
+        elapsed = await run_concurrently(one, prompts, args.concurrency)
+        return {
+            "success_rate": round(len(latency) / args.requests, 3),
+            "errors": errors,
+            "upstream_requests": app.state.stats["requests"] - upstream_before,
+            "requests_per_sec": round(args.requests / elapsed, 1),
+            "latency": percentiles(latency),
+        }
+
+    try:
+        results = {name: asyncio.run(run(factory())) for name, factory in
+                   (("sdk_default", sdk_default), ("resilient", resilient))}
+    finally:
+        server.should_exit = True
+    return {
+        "benchmark": "transport",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "stub": {"latency": args.latency, "slow_rate": args.slow_rate, "slow_latency": args.slow_latency,
+                 "failure_rate": args.failure_rate},
+        "deadline": args.deadline,
+        "retries": args.retries,
+        "hedge_after": args.hedge_after,
+        "results": results,
+    }
+
+
+# Modules main.py used to import eagerly; kept as the baseline for import time
+HEAVY_MODULES = ["langchain_openai", "langchain_community.document_loaders", "sentence_transformers", "pymilvus"]
+
+
+def import_seconds(statement):
+    """Wall time of a statement in a fresh interpreter"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def server_startup(timeout):
+    """Seconds from launching `main.py --api` until the liveness and readiness probes pass"""
+    port = free_port()
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark"),
+           "MILVUS_DB_FILE": BENCH_DB_FILE}
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py", "--api", "--host", "127.0.0.1", "--port", str(port)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {"live_seconds": None, "ready_seconds": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            while time.perf_counter() - start < timeout and process.poll() is None:
+                probe = "live" if timings["live_seconds"] is None else "ready"
+                try:
+                    if client.get(f"/api/health/{probe}").status_code == 200:
+                        timings[f"{probe}_seconds"] = round(time.perf_counter() - start, 3)
+                        if probe == "ready":
+                            break
+                        continue
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    return timings
+
+
+def bench_startup(args):
+    """Import time of main.py vs its heavy dependencies, and server time-to-live / time-to-ready"""
+    main_import = [import_seconds("import main") for _ in range(args.repeat)]
+    heavy_import = [import_seconds("import " + ", ".join(HEAVY_MODULES)) for _ in range(args.repeat)]
+    servers = [server_startup(args.timeout) for _ in range(args.servers)]
+
+    def median(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    return {
+        "benchmark": "startup",
+        "repeat": args.repeat,
+        "import_main_seconds": median(main_import),
+        "import_heavy_modules_seconds": median(heavy_import),
+        "server_runs": len(servers),
+        "time_to_live_seconds": median([s["live_seconds"] for s in servers]),
+        "time_to_ready_seconds": median([s["ready_seconds"] for s in servers]),
+    }
+
+
+def ready_pids(base_url, probes):
+    """pids of workers answering the readiness probe, one fresh connection per probe"""
+    pids = set()
+    for _ in range(probes):
+        try:
+            response = httpx.get(f"{base_url}/api/health/ready", timeout=1.0)
+        except httpx.TransportError:
+            continue
+        if response.status_code == 200:
+            pids.add(response.json()["pid"])
+    return pids
+
+
+def bench_workers(args):
+    """Boot `main.py --api --workers N` against a Milvus server URI, then kill a worker.
+
+    Passes when the leader's ingest succeeds, every worker becomes ready on the
+    read-only index, and the killed worker is replaced by a new ready one.
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    state_dir = tempfile.mkdtemp(prefix="bench_workers_")
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark"),
+           "MILVUS_DB_FILE": args.uri, "VECTOR_STORE": "milvus", "INDEX_STATE_DIR": state_dir,
+           "COLLECTION_NAME": "bench_workers", "PERSISTENT_INDEX": "true"}
+    report = {"benchmark": "workers", "uri": args.uri, "workers": args.workers,
+              "ready_seconds": None, "respawn_seconds": None, "passed": False}
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py", "--api", "--host", "127.0.0.1", "--port", str(port),
+                                "--workers", str(args.workers)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = set()
+        while len(ready) < args.workers and time.perf_counter() - start < args.timeout and process.poll() is None:
+            ready |= ready_pids(base_url, args.workers * 4)
+            time.sleep(0.1)
+        report["ready_workers"] = len(ready)
+        if len(ready) < args.workers:
+            return report
+        report["ready_seconds"] = round(time.perf_counter() - start, 3)
+
+        os.kill(ready.pop(), signal.SIGKILL)
+        killed_at = time.perf_counter()
+        while time.perf_counter() - killed_at < args.timeout and process.poll() is None:
+            replacements = ready_pids(base_url, args.workers * 4) - ready
+            if replacements:
+                report["respawn_seconds"] = round(time.perf_counter() - killed_at, 3)
+                break
+            time.sleep(0.1)
+        report["passed"] = report["respawn_seconds"] is not None
+    finally:
+        process.terminate()
+        report["exit_code"] = process.wait()
+        shutil.rmtree(state_dir, ignore_errors=True)
+    return report
+
+
+def profile_encoder(backend, threads, chunks, queries, repeat):
+    """Runs in a fresh process: load time, peak RSS, throughput and query latency of one backend"""
+    import resource
+    from rag_engine import load_encoder
+
+    start = time.perf_counter()
+    encoder = load_encoder(backend, threads)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunk_vectors = np.asarray(encoder.encode(chunks, batch_size=64, normalize_embeddings=True))
+    ingest_seconds = time.perf_counter() - start
+    query_vectors = np.asarray(encoder.encode(queries, normalize_embeddings=True))
+
+    latency = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            encoder.encode(query)
+            latency.append(time.perf_counter() - start)
+    return {
+        "load_seconds": round(load_seconds, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "chunks_per_sec": round(len(chunks) / ingest_seconds, 1),
+        "query_latency": percentiles(latency),
+        "chunk_vectors": chunk_vectors,
+        "query_vectors": query_vectors,
+    }
+
+
+def parity(reference, candidate, top_k):
+    """Cosine agreement with the reference vectors, and recall of the reference's brute-force top-k"""
+    chunk_cos = np.sum(reference["chunk_vectors"] * candidate["chunk_vectors"], axis=1)
+    query_cos = np.sum(reference["query_vectors"] * candidate["query_vectors"], axis=1)
+    k = min(top_k, len(reference["chunk_vectors"]))
+    expected = np.argsort(-(reference["query_vectors"] @ reference["chunk_vectors"].T), axis=1)[:, :k]
+    actual = np.argsort(-(candidate["query_vectors"] @ candidate["chunk_vectors"].T), axis=1)[:, :k]
+    recall = [len(set(e) & set(a)) / k for e, a in zip(expected, actual)]
+    return {
+        "chunk_cosine_mean": round(float(chunk_cos.mean()), 5),
+        "chunk_cosine_min": round(float(chunk_cos.min()), 5),
+        "query_cosine_mean": round(float(query_cos.mean()), 5),
+        "query_cosine_min": round(float(query_cos.min()), 5),
+        f"recall_at_{k}_vs_torch": round(float(np.mean(recall)), 3),
+        "top1_agreement": round(float(np.mean(expected[:, 0] == actual[:, 0])), 3),
+    }
+
+
+def labelled_recall(profile, hits, labelled, top_k):
+    """Share of labelled queries whose relevant chunk is in a backend's brute-force top-k"""
+    scores = profile["query_vectors"][:len(labelled)] @ profile["chunk_vectors"].T
+    top = np.argsort(-scores, axis=1)[:, :top_k]
+    found = [any(_is_relevant(hits[i], source, answer) for i in row) for row, (_, source, answer) in zip(top, labelled)]
+    return round(float(np.mean(found)), 3)
+
+
+def bench_encoders(args):
+    """Parity, latency and memory of encoder backends against the fp32 torch model.
+
+    With --corpus, chunks and labelled queries come from a data_gen.py corpus
+    instead of the three sample PDFs.
+    """
+    files = sorted(glob.glob(os.path.join(args.corpus, "*.pdf"))) if args.corpus else DATA_FILES
+    with contextlib.redirect_stdout(io.StringIO()):
+        docs = [doc for path in files for doc in load_and_split(path)]
+    chunks = [doc.page_content for doc in docs]
+    hits = [{"source": doc.metadata.get("source", ""), "text": doc.page_content} for doc in docs]
+    labelled = load_retrieval_queries(os.path.join(args.corpus, "queries.jsonl") if args.corpus else None)
+    # Labelled queries first; the routing set adds short queries to the small built-in set
+    queries = [query for query, _, _ in labelled] + ([] if args.corpus else [query for query, _ in ROUTING_QUERIES])
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+
+    profiles = {}
+    for backend in backends:
+        # A fresh process per backend so load time and peak memory are not shared
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                profiles[backend] = pool.submit(profile_encoder, backend, args.threads, chunks, queries,
+                                                args.repeat).result()
+            except Exception as e:
+                profiles[backend] = {"error": str(e)}
+
+    results = {}
+    reference = profiles["torch"]
+    for backend, profile in profiles.items():
+        if "error" in profile:
+            results[backend] = profile
+            continue
+        results[backend] = {key: value for key, value in profile.items() if not key.endswith("_vectors")}
+        results[backend][f"labelled_recall_at_{args.top_k}"] = labelled_recall(profile, hits, labelled, args.top_k)
+        if backend != "torch" and "error" not in reference:
+            results[backend]["parity"] = parity(reference, profile, args.top_k)
+    return {
+        "benchmark": "encoders",
+        "corpus": args.corpus or "sample",
+        "documents": len(files),
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "threads": args.threads,
+        "results": results,
+    }
+
+
+def directory_size_mb(path):
+    if os.path.isfile(path):
+        return round(os.path.getsize(path) / 2 ** 20, 1)
+    return round(sum(os.path.getsize(os.path.join(root, name))
+                     for root, _, names in os.walk(path) for name in names) / 2 ** 20, 1)
+
+
+def bench_stores(args):
+    """Milvus Lite vs the memory-mapped NumPy store on synthetic MiniLM-sized vectors"""
+    from pymilvus import MilvusClient
+
+    rng = np.random.default_rng(0)
+    dim = 384
+    vectors = rng.standard_normal((args.chunks, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = [{"id": i, "vector": vectors[i].tolist(), "text": f"chunk {i}", "source": "synthetic.pdf"}
+            for i in range(args.chunks)]
+    # Queries near stored vectors, as real queries land near relevant chunks
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] + \
+        0.5 * rng.standard_normal((args.queries, dim), dtype=np.float32) / np.sqrt(dim)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.top_k]
+
+    workdir = tempfile.mkdtemp(prefix="bench_stores_")
+    stores = {
+        "milvus_lite": lambda: MilvusClient(os.path.join(workdir, "milvus.db")),
+        "numpy_float32": lambda: FlatVectorStore(os.path.join(workdir, "flat32"), dtype="float32"),
+        "numpy_float16": lambda: FlatVectorStore(os.path.join(workdir, "flat16"), dtype="float16"),
+    }
+    paths = {"milvus_lite": "milvus.db", "numpy_float32": "flat32", "numpy_float16": "flat16"}
+    results = {}
+    try:
+        for name, factory in stores.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                client = factory()
+                client.create_collection(collection_name="bench", dimension=dim)
+                start = time.perf_counter()
+                for i in range(0, len(rows), 512):
+                    client.upsert(collection_name="bench", data=rows[i:i + 512])
+                if isinstance(client, FlatVectorStore):
+                    client.save("bench")
+                insert_seconds = time.perf_counter() - start
+
+            latency, found = [], []
+            for query in queries:
+                start = time.perf_counter()
+                hits = client.search(collection_name="bench", data=[query.tolist()], limit=args.top_k,
+                                     output_fields=["text", "source"])[0]
+                latency.append(time.perf_counter() - start)
+                found.append([hit["id"] for hit in hits])
+            recall = np.mean([len(set(f) & set(e)) / args.top_k for f, e in zip(found, exact)])
+
+            batch = queries[:args.batch_size].tolist()
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                client.search(collection_name="bench", data=batch, limit=args.top_k, output_fields=["text", "source"])
+            batch_seconds = (time.perf_counter() - start) / args.repeat
+
+            results[name] = {
+                "insert_seconds": round(insert_seconds, 3),
+                "query_latency": percentiles(latency),
+                f"recall_at_{args.top_k}": round(float(recall), 4),
+                "batched_queries_per_sec": round(len(batch) / batch_seconds, 1),
+                "disk_mb": directory_size_mb(os.path.join(workdir, paths[name])),
+            }
+            if hasattr(client, "close"):
+                client.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "benchmark": "stores",
+        "chunks": args.chunks,
+        "queries": args.queries,
+        "top_k": args.top_k,
+        "batch_size": args.batch_size,
+        "results": results,
+    }
+
+
+async def tool_workload(args):
+    backend = MockBankingBackend(latency=args.latency, jitter=args.latency / 2)
+    cache = ToolCache()
+    accounts, transactions, cards = (AccountTool(backend, cache), TransactionTool(backend, cache),
+                                     CardTool(backend, cache))
+    account_id = "123456789"
+
+    # A burst of identical lookups: direct backend calls vs the coalescing read-through cache
+    burst = {}
+    for name, lookup in (("backend", backend.get_balance), ("cached", accounts.get_balance)):
+        calls = backend.calls["get_balance"]
+        start = time.perf_counter()
+        await asyncio.gather(*(lookup(account_id) for _ in range(args.concurrency)))
+        burst[name] = {"seconds": round(time.perf_counter() - start, 3),
+                       "backend_calls": backend.calls["get_balance"] - calls}
+        cache.invalidate(account_id)
+
+    # Details + balance + transactions one after another vs concurrently (cold cache both times)
+    start = time.perf_counter()
+    await backend.get_details(account_id)
+    await backend.get_balance(account_id)
+    await backend.get_recent_transactions(account_id)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    await accounts.get_overview(account_id)
+    fan_out = time.perf_counter() - start
+
+    # Mixed reads and writes: every read must reflect all writes that finished before it started
+    rng = random.Random(0)
+    stale = 0
+    latency = []
+    for _ in range(args.operations):
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < args.write_rate / 2:
+            await transactions.transfer_funds(account_id, "987654321", 10)
+        elif roll < args.write_rate:
+            await cards.block_card("4321")
+        else:
+            overview = await accounts.get_overview(account_id)
+            latency.append(time.perf_counter() - start)
+            truth = backend._accounts[account_id]
+            if overview["balance"] != round(truth["balance"], 2) or \
+                    overview["recent_transactions"][0] != truth["transactions"][0] or \
+                    [c["status"] for c in overview["cards"]] != list(truth["cards"].values()):
+                stale += 1
+    return {
+        "burst": burst,
+        "overview_seconds": {"sequential": round(sequential, 3), "concurrent": round(fan_out, 3)},
+        "mixed": {"operations": args.operations, "write_rate": args.write_rate,
+                  "read_latency": percentiles(latency), "stale_reads": stale, "cache": cache.stats(),
+                  "backend_calls": dict(backend.calls)},
+    }
+
+
+def bench_tools(args):
+    """Banking tool layer against the mock backend with injected latency"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(tool_workload(args))
+    return {"benchmark": "tools", "latency_s": args.latency, "concurrency": args.concurrency, **results}
+
+
+def bench_replay(args):
+    """Replay a query corpus through route_query and/or /api/ask against the stub LLM"""
+    orchestrator = build_orchestrator(args.latency, args.tokens_per_sec,
+                                      answer_cache_size=512 if args.answer_cache else 0)
+    corpus = load_corpus(args.corpus)
+    queries = [corpus[i % len(corpus)] for i in range(args.requests or len(corpus))]
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.target in ("orchestrator", "both"):
+            results["route_query"] = replay_orchestrator(orchestrator, queries, args.concurrency)
+        if args.target in ("api", "both"):
+            results["api_ask"] = asyncio.run(replay_api(orchestrator, queries, args.concurrency))
+    return {
+        "benchmark": "replay",
+        "corpus": args.corpus or "builtin",
+        "requests": len(queries),
+        "concurrency": args.concurrency,
+        "llm_latency": args.latency,
+        "llm_tokens_per_sec": args.tokens_per_sec,
+        "answer_cache": args.answer_cache,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banking AI Assistant benchmarks")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    load = subparsers.add_parser("load", help="sync vs async request path under concurrent load")
+    load.add_argument("--requests", type=int, default=100)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    load.set_defaults(func=bench_load)
+
+    routing = subparsers.add_parser("routing", help="embedding intent router vs keyword router")
+    routing.add_argument("--queries", help='JSONL of {"query", "intent"}, e.g. a data_gen.py query set '
+                                           '(default: built-in set)')
+    routing.add_argument("--repeat", type=int, default=20)
+    routing.set_defaults(func=bench_routing)
+
+    audit = subparsers.add_parser("audit", help="per-request audit logging overhead")
+    audit.add_argument("--records", type=int, default=20000)
+    audit.set_defaults(func=bench_audit)
+
+    retrieval = subparsers.add_parser("retrieval", help="recall@k and latency of vector vs hybrid retrieval")
+    retrieval.add_argument("--corpus", help="directory of a data_gen.py corpus to index instead of data/")
+    retrieval.add_argument("--ingest-workers", type=int, default=1)
+    retrieval.add_argument("--queries", help='JSONL of {"query", "source", "answer"} '
+                                             '(default: the corpus queries.jsonl, else a built-in set)')
+    retrieval.add_argument("--top-k", type=int, nargs="+", default=[1, 3])
+    retrieval.add_argument("--candidates", type=int, default=20, help="results each side contributes to fusion")
+    retrieval.add_argument("--repeat", type=int, default=5)
+    retrieval.set_defaults(func=bench_retrieval)
+
+    transport = subparsers.add_parser("transport", help="LLM client resilience against a slow, failing stub server")
+    transport.add_argument("--requests", type=int, default=200)
+    transport.add_argument("--concurrency", type=int, default=16)
+    transport.add_argument("--latency", type=float, default=0.1, help="normal stub response time in seconds")
+    transport.add_argument("--slow-rate", type=float, default=0.05)
+    transport.add_argument("--slow-latency", type=float, default=3.0)
+    transport.add_argument("--failure-rate", type=float, default=0.05)
+    transport.add_argument("--deadline", type=float, default=10.0, help="per-call deadline in seconds")
+    transport.add_argument("--retries", type=int, default=2)
+    transport.add_argument("--hedge-after", type=float, default=0.5, help="hedge delay in seconds (0 disables)")
+    transport.set_defaults(func=bench_transport)
+
+    startup = subparsers.add_parser("startup", help="import time and server time-to-live / time-to-ready")
+    startup.add_argument("--repeat", type=int, default=5, help="fresh-interpreter imports to time")
+    startup.add_argument("--servers", type=int, default=1, help="server launches to time")
+    startup.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for readiness")
+    startup.set_defaults(func=bench_startup)
+
+    workers = subparsers.add_parser("workers", help="boot several API workers against a Milvus server URI")
+    workers.add_argument("--uri", default="http://localhost:19530", help="Milvus server URI")
+    workers.add_argument("--workers", type=int, default=2)
+    workers.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for readiness")
+    workers.set_defaults(func=bench_workers)
+
+    encoders = subparsers.add_parser("encoders", help="parity, latency and memory of embedding backends")
+    encoders.add_argument("--corpus", help="directory of a data_gen.py corpus to encode instead of data/")
+    encoders.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    encoders.add_argument("--threads", type=int, default=None, help="intra-op threads per backend")
+    encoders.add_argument("--top-k", type=int, default=3)
+    encoders.add_argument("--repeat", type=int, default=5)
+    encoders.set_defaults(func=bench_encoders)
+
+    stores = subparsers.add_parser("stores", help="Milvus Lite vs memory-mapped NumPy vector store")
+    stores.add_argument("--chunks", type=int, default=20000)
+    stores.add_argument("--queries", type=int, default=200)
+    stores.add_argument("--top-k", type=int, default=3)
+    stores.add_argument("--batch-size", type=int, default=32, help="queries per batched search")
+    stores.add_argument("--repeat", type=int, default=10)
+    stores.set_defaults(func=bench_stores)
+
+    tools = subparsers.add_parser("tools", help="tool cache, request coalescing and concurrent fan-out")
+    tools.add_argument("--latency", type=float, default=0.05, help="mock backend latency in seconds")
+    tools.add_argument("--concurrency", type=int, default=50, help="identical lookups in the burst")
+    tools.add_argument("--operations", type=int, default=500, help="mixed read/write operations")
+    tools.add_argument("--write-rate", type=float, default=0.1)
+    tools.set_defaults(func=bench_tools)
+
+    replay = subparsers.add_parser("replay", help="replay a query corpus and report per-stage latency")
+    replay.add_argument("--corpus", help="JSONL or text file of queries (default: built-in queries)")
+    replay.add_argument("--target", choices=["orchestrator", "api", "both"], default="both")
+    replay.add_argument("--requests", type=int, default=0, help="requests to send (default: one pass over the corpus)")
+    replay.add_argument("--concurrency", type=int, default=8)
+    replay.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    replay.add_argument("--tokens-per-sec", type=float, default=0.0, help="stub LLM token rate (0 = instant)")
+    replay.add_argument("--answer-cache", action="store_true", help="enable the semantic answer cache")
+    replay.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    report = json.dumps(args.func(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
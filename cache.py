@@ -0,0 +1,140 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(query):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class SemanticCache:
+    """Answer cache matched by query embedding similarity.
+
+    Entries are grouped under an exact ``key`` (e.g. retrieved chunk IDs and
+    prompt version); within a key, a lookup hits when the cosine similarity
+    between query embeddings reaches ``threshold``.
+    """
+
+    def __init__(self, maxsize=512, threshold=0.95, ttl=3600.0):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        # (key, normalized query) -> (unit vector, answer, expires_at), in LRU order
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, key, query, vector):
+        now = time.monotonic()
+        entry_key = (key, normalize_query(query))
+        with self._lock:
+            exact = self._entries.get(entry_key)
+            if exact is not None and exact[2] > now:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return exact[1]
+
+            candidates = [(k, v) for k, v in self._entries.items() if k[0] == key and v[2] > now]
+            if candidates:
+                scores = np.stack([v[0] for _, v in candidates]) @ self._unit(vector)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_key, entry = candidates[best]
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, key, query, vector, answer):
+        if self.maxsize <= 0:
+            return
+        entry_key = (key, normalize_query(query))
+        with self._lock:
+            self._entries[entry_key] = (self._unit(vector), answer, time.monotonic() + self.ttl)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,165 @@
+import os
+import numpy as np
+from cache import TTLCache
+from memory import count_tokens, truncate_tokens
+from metrics import CONTEXT_TOKENS, annotate, timed
+from rag_engine import CHUNK_OVERLAP, format_context
+
+# Below this many shared characters two chunks are not treated as adjacent
+MIN_OVERLAP = 20
+
+
+def _overlap(first, second, max_overlap):
+    """Length of the longest suffix of first that is a prefix of second"""
+    for size in range(min(len(first), len(second), max_overlap), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def _add_chunk(block, hit):
+    block["ids"].append(hit["id"])
+    if hit.get("vector") is not None:
+        block["vectors"].append(hit["vector"])
+
+
+def _merge(blocks, hit, max_overlap):
+    """Fold hit into a block of the same source it overlaps with; False if none"""
+    for block in blocks:
+        if block["source"] != hit["source"]:
+            continue
+        if hit["text"] in block["text"]:
+            _add_chunk(block, hit)
+            return True
+        after = _overlap(block["text"], hit["text"], max_overlap)
+        if after:
+            block["text"] += hit["text"][after:]
+        else:
+            before = _overlap(hit["text"], block["text"], max_overlap)
+            if not before:
+                continue
+            block["text"] = hit["text"] + block["text"][before:]
+        _add_chunk(block, hit)
+        return True
+    return False
+
+
+class ContextAssembler:
+    """Builds the RAG prompt's knowledge-base block from retrieved chunks.
+
+    Chunks of the same document that overlap (the splitter repeats up to
+    ``CHUNK_OVERLAP`` characters) are merged, blocks nearly identical to a
+    higher-ranked one are dropped, and the rest are packed in rank order
+    into ``max_tokens`` (0 or None means no budget). Duplicates are found
+    with the chunk vectors stored in the index (hits' ``vector``); only
+    chunks without one are encoded.
+    """
+
+    def __init__(self, encoder, max_tokens=1500, dedup_threshold=0.92, max_overlap=CHUNK_OVERLAP,
+                 vector_cache_size=4096):
+        self.encoder = encoder
+        self.max_tokens = max_tokens
+        # Cosine similarity above which a block counts as a duplicate (>= 1 disables)
+        self.dedup_threshold = dedup_threshold
+        self.max_overlap = max_overlap
+        # Chunk IDs of a block without stored vectors -> unit embedding, so such chunks are encoded once
+        self.vector_cache = TTLCache(maxsize=vector_cache_size)
+
+    @staticmethod
+    def _unit(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+    def _unit_vectors(self, blocks):
+        """Unit vector per block: the mean of its chunks' stored vectors, else one batched encode"""
+        vectors = [None] * len(blocks)
+        missing = []
+        for i, block in enumerate(blocks):
+            if block["vectors"] and len(block["vectors"]) == len(block["ids"]):
+                vectors[i] = self._unit(self._unit(block["vectors"]).mean(axis=0))
+            else:
+                vectors[i] = self.vector_cache.get(tuple(block["ids"]))
+                if vectors[i] is None:
+                    missing.append(i)
+        if missing:
+            encoded = self._unit(self.encoder.encode([blocks[i]["text"] for i in missing]))
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+                self.vector_cache.set(tuple(blocks[i]["ids"]), vector)
+        return vectors
+
+    def _needs_dedup(self, blocks):
+        return len(blocks) >= 2 and self.dedup_threshold < 1
+
+    def _deduplicate(self, blocks, vectors):
+        if not self._needs_dedup(blocks):
+            return blocks
+        kept, kept_vectors = [], []
+        for block, vector in zip(blocks, vectors):
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ vector)) >= self.dedup_threshold:
+                continue
+            kept.append(block)
+            kept_vectors.append(vector)
+        return kept
+
+    def _pack(self, blocks):
+        # Same layout as format_context
+        pieces = [f"[Source: {os.path.basename(block['source'])}]\n{block['text']}" for block in blocks]
+        if not self.max_tokens:
+            return pieces
+        packed, used = [], 0
+        for piece in pieces:
+            tokens = count_tokens(piece) + (2 if packed else 0)
+            if used + tokens <= self.max_tokens:
+                packed.append(piece)
+                used += tokens
+            elif not packed:
+                # Never send an empty context: keep as much of the best block as fits
+                packed.append(truncate_tokens(piece, self.max_tokens))
+                used = self.max_tokens
+        return packed
+
+    def _blocks(self, hits):
+        blocks = []
+        for hit in hits:
+            if not _merge(blocks, hit, self.max_overlap):
+                blocks.append({"source": hit["source"], "text": hit["text"], "ids": [], "vectors": []})
+                _add_chunk(blocks[-1], hit)
+        return blocks
+
+    def assemble(self, hits):
+        """Return (context, report) for hits in rank order"""
+        return self.assemble_many([hits])[0]
+
+    def assemble_many(self, hits_per_query):
+        """assemble for several queries; chunks without stored vectors share one encoder call"""
+        with timed("context_assembly"):
+            blocks_per_query = [self._blocks(hits) for hits in hits_per_query]
+            pending = [block for blocks in blocks_per_query if self._needs_dedup(blocks) for block in blocks]
+            vectors = iter(self._unit_vectors(pending))
+            contexts = []
+            for blocks in blocks_per_query:
+                block_vectors = [next(vectors) for _ in blocks] if self._needs_dedup(blocks) else None
+                unique = self._deduplicate(blocks, block_vectors)
+                pieces = self._pack(unique)
+                contexts.append((blocks, unique, pieces))
+        return [self._report(hits, *assembled) for hits, assembled in zip(hits_per_query, contexts)]
+
+    def _report(self, hits, blocks, unique, pieces):
+        """(context, report) for one query, counting its tokens in the metrics and trace"""
+        context = "\n\n".join(pieces)
+        retrieved_tokens = count_tokens(format_context(hits)) if hits else 0
+        context_tokens = count_tokens(context) if context else 0
+        report = {
+            "chunks": len(hits),
+            "merged": len(hits) - len(blocks),
+            "deduplicated": len(blocks) - len(unique),
+            "blocks": len(pieces),
+            "retrieved_tokens": retrieved_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": retrieved_tokens - context_tokens,
+        }
+        CONTEXT_TOKENS.labels(stage="retrieved").inc(retrieved_tokens)
+        CONTEXT_TOKENS.labels(stage="sent").inc(context_tokens)
+        annotate("context", report)
+        return context, report
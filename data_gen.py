@@ -1,29 +1,40 @@
 import os
+import json
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 
 DATA_DIR = "data"
+CORPUS_DIR = os.path.join(DATA_DIR, "corpus")
+# Documents each corpus worker task writes, so tasks are neither tiny nor uneven
+CORPUS_TASK_SIZE = 50
 
-def create_pdf(filename, content):
-    os.makedirs(DATA_DIR, exist_ok=True)
-    filepath = os.path.join(DATA_DIR, filename)
+def write_pdf(filepath, title, lines):
     c = canvas.Canvas(filepath, pagesize=letter)
     width, height = letter
     
     c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, height - 50, filename.replace(".pdf", "").replace("_", " ").title())
+    c.drawString(50, height - 50, title)
     
     c.setFont("Helvetica", 12)
     y_position = height - 80
     
-    for line in content.split('\n'):
+    for line in lines:
         if y_position < 50:
             c.showPage()
+            c.setFont("Helvetica", 12)
             y_position = height - 50
         c.drawString(50, y_position, line)
         y_position -= 15
         
     c.save()
+
+def create_pdf(filename, content):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filepath = os.path.join(DATA_DIR, filename)
+    write_pdf(filepath, filename.replace(".pdf", "").replace("_", " ").title(), content.split('\n'))
     print(f"Generated {filepath}")
 
 def generate_data():
@@ -72,5 +83,224 @@ def generate_data():
     create_pdf("KYC_requirements.pdf", kyc_requirements_content)
     create_pdf("dispute_process.pdf", dispute_process_content)
 
+# Building blocks for the synthetic corpus. Every document is named after a
+# product with a unique code, and its sections repeat that name, so a query
+# naming the product has one right source even among thousands of look-alikes.
+PRODUCT_ADJECTIVES = ["Summit", "Harbor", "Evergreen", "Liberty", "Pioneer", "Cascade", "Meridian", "Beacon",
+                      "Granite", "Horizon", "Keystone", "Prairie", "Redwood", "Sterling", "Tidewater", "Union"]
+PRODUCT_NOUNS = ["Essential", "Rewards", "Premier", "Student", "Senior", "Advantage", "Select", "Everyday"]
+FEE_PRODUCTS = ["Checking", "Interest Checking", "Money Market", "Savings", "Business Checking"]
+CARD_PRODUCTS = ["Debit Card", "Cash Back Credit Card", "Travel Credit Card", "Secured Credit Card",
+                 "Business Debit Card"]
+KYC_SEGMENTS = ["Personal Accounts", "Joint Accounts", "Business Accounts", "Trust Accounts",
+                "Nonresident Accounts", "Minor Accounts"]
+PHOTO_IDS = ["Driver's License", "Passport", "State ID", "Military ID", "Permanent Resident Card",
+             "Consular ID"]
+ADDRESS_PROOFS = ["Utility bill", "Bank statement", "Lease agreement", "Property tax bill", "Insurance policy"]
+BUSINESS_DOCUMENTS = ["Articles of Incorporation", "Certificate of Good Standing", "Operating Agreement",
+                      "Partnership Agreement", "Business License", "Board Resolution"]
+PERSONAL_TAX_IDS = ["Social Security Number (SSN)", "ITIN", "Foreign Tax Identification Number"]
+DISPUTE_CHANNELS = ["the mobile app 'Dispute' feature", "online banking", "customer service",
+                    "any branch", "the card services line"]
+
+# Tool intents of router.INTENT_EXEMPLARS, phrased differently from the exemplars
+TOOL_QUERY_TEMPLATES = {
+    "account_balance": ["What's the balance on my {account} account?", "How much do I have in {account}?",
+                        "Can you tell me my current balance?", "Is there enough money in my {account} account?"],
+    "account_details": ["Is my {account} account still open?", "What kind of account is my {account}?",
+                        "Who is listed as the holder of my account?", "Show me the details of my {account} account"],
+    "account_overview": ["Give me a quick summary of my {account} account", "How is my {account} account doing overall?",
+                         "Recap my account: balance, status and latest payments", "Overview of my {account} account please"],
+    "recent_transactions": ["What were my last {count} transactions?", "Show the payments from my {account} account",
+                            "Did my paycheck arrive?", "List the charges on my account this week"],
+    "transfer_funds": ["Transfer ${amount} to account {target}", "Send ${amount} to {name}",
+                       "Move ${amount} from {account} to savings", "Please pay {name} ${amount}"],
+    "block_card": ["My card ending in {last4} was stolen, block it", "Freeze my card right now",
+                   "I think someone copied my card ending {last4}", "Lock my debit card, I lost it"],
+    "replace_card": ["My card ending in {last4} is cracked, send a new one", "I need a replacement debit card",
+                     "Can I get a new card? Mine stopped working", "Please reissue my card ending {last4}"],
+}
+TOOL_NAMES = ["my landlord", "Alex", "my sister", "Sam", "the plumber", "Jordan", "my roommate"]
+
+def money(value):
+    return f"${value:,.2f}"
+
+def product_name(rng, kinds, code):
+    return f"{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NOUNS)} {rng.choice(kinds)} ({code})"
+
+def fee_schedule_document(rng, code):
+    """(title, lines, [(question, answer)]) of a randomized fee schedule"""
+    product = product_name(rng, FEE_PRODUCTS, code)
+    maintenance = rng.choice([0, 5, 8, 10, 12, 15, 25])
+    waiver = rng.choice([500, 1000, 1500, 2500, 5000])
+    overdraft = rng.choice([0, 15, 25, 29, 32, 35, 36])
+    atm = rng.choice([2, 2.5, 3, 3.5, 5])
+    withdrawals = rng.choice([3, 6, 8])
+    withdrawal_fee = rng.choice([3, 5, 10, 15])
+    stop_payment = rng.choice([20, 25, 30, 35])
+    wires = {direction: rng.choice(choices) for direction, choices in (
+        ("Domestic Incoming", [0, 10, 15, 17]), ("Domestic Outgoing", [20, 25, 30, 35]),
+        ("International Incoming", [0, 15, 16, 20]), ("International Outgoing", [35, 40, 45, 50, 65]))}
+    lines = [
+        f"{product} Account Fees:",
+        f"- Monthly Maintenance Fee: {money(maintenance)} (waived with {money(waiver)} min daily balance)",
+        f"- Overdraft Fee: {money(overdraft)} per item",
+        f"- ATM Fee (Non-Network): {money(atm)} per transaction",
+        f"- Stop Payment Fee: {money(stop_payment)} per request",
+        "",
+        f"{product} Savings Withdrawals:",
+        f"- Excessive Withdrawal Fee: {money(withdrawal_fee)} per withdrawal over {withdrawals} per month",
+        "",
+        f"{product} Wire Transfers:",
+    ] + [f"- {direction}: {money(fee)}" for direction, fee in wires.items()]
+    direction = rng.choice(list(wires))
+    questions = [
+        (f"What is the overdraft fee on the {product}?", money(overdraft)),
+        (f"How much is the monthly maintenance fee for {product}?", money(maintenance)),
+        (f"What balance waives the maintenance fee on {product}?", money(waiver)),
+        (f"{product} ATM Fee (Non-Network)", money(atm)),
+        (f"What does a stop payment cost on the {product}?", money(stop_payment)),
+        (f"Excessive withdrawal fee for {product} savings", money(withdrawal_fee)),
+        (f"What is the {direction.lower()} wire fee for {product}?", money(wires[direction])),
+    ]
+    return f"Fee Schedule - {product}", lines, questions
+
+def kyc_document(rng, code):
+    segment = f"{rng.choice(KYC_SEGMENTS)} ({code})"
+    ids = rng.sample(PHOTO_IDS, 3)
+    proofs = rng.sample(ADDRESS_PROOFS, 3)
+    address_days = rng.choice([30, 60, 90, 120])
+    tax_ids = rng.sample(PERSONAL_TAX_IDS, 2)
+    business = rng.sample(BUSINESS_DOCUMENTS, 3)
+    review_days = rng.choice([2, 3, 5, 7, 10])
+    lines = [
+        f"Know Your Customer (KYC) Requirements for {segment}:",
+        "",
+        f"To open a new account under {segment}, you must provide:",
+        f"1. Valid Government-Issued Photo ID ({', '.join(ids)})",
+        f"2. Proof of Address ({', '.join(proofs)} - dated within last {address_days} days)",
+        f"3. {tax_ids[0]} or {tax_ids[1]}",
+        "",
+        f"Additional documents for business owners under {segment}:",
+        f"- {business[0]}",
+        f"- {business[1]}",
+        f"- {business[2]}",
+        "- EIN (Employer Identification Number)",
+        "",
+        f"Applications under {segment} are reviewed within {review_days} business days.",
+    ]
+    questions = [
+        (f"How recent must proof of address be for {segment}?", f"{address_days} days"),
+        (f"Is a {ids[1]} accepted as photo ID for {segment}?", ids[1]),
+        (f"Can I use a {proofs[2].lower()} as proof of address for {segment}?", proofs[2]),
+        (f"Which business documents are needed for {segment}?", business[0]),
+        (f"How long does KYC review take for {segment}?", f"{review_days} business days"),
+    ]
+    return f"KYC Requirements - {segment}", lines, questions
+
+def dispute_document(rng, code):
+    product = product_name(rng, CARD_PRODUCTS, code)
+    notify_days = rng.choice([30, 60, 90, 120])
+    credit_days = rng.choice([5, 10, 15, 20])
+    low, high = rng.choice([(30, 45), (45, 90), (60, 90), (30, 60)])
+    research_fee = rng.choice([0, 10, 15, 25])
+    channels = rng.sample(DISPUTE_CHANNELS, 2)
+    lines = [
+        f"Transaction Dispute Process for the {product}:",
+        "",
+        f"1. Notification: {product} holders must notify the bank within {notify_days} days",
+        "   of the statement date where the error appeared.",
+        f"2. Provisional Credit: We will provide provisional credit within {credit_days} business days.",
+        f"3. Investigation: Investigations typically take {low}-{high} days depending on the transaction type.",
+        f"4. Research Fee: {money(research_fee)} per disputed item found to be valid charges.",
+        "5. Resolution: You will be notified in writing of the outcome.",
+        "",
+        f"To initiate a {product} dispute, use {channels[0]} or {channels[1]}.",
+    ]
+    questions = [
+        (f"How long do I have to report an error on my {product}?", f"{notify_days} days"),
+        (f"When do I get provisional credit on a {product} dispute?", f"{credit_days} business days"),
+        (f"How long does a {product} dispute investigation take?", f"{low}-{high} days"),
+        (f"Is there a research fee for disputes on the {product}?", money(research_fee)),
+        (f"How do I start a dispute on my {product}?", channels[0]),
+    ]
+    return f"Dispute Process - {product}", lines, questions
+
+CORPUS_DOCUMENTS = [("fee_schedule", "FEE", fee_schedule_document), ("kyc_requirements", "KYC", kyc_document),
+                    ("dispute_process", "DSP", dispute_document)]
+
+def tool_query(rng):
+    intent = rng.choice(list(TOOL_QUERY_TEMPLATES))
+    query = rng.choice(TOOL_QUERY_TEMPLATES[intent]).format(
+        account=rng.choice(["checking", "savings", "joint"]), count=rng.randint(3, 20),
+        amount=rng.choice([20, 75, 100, 250, 1200]), target=rng.randint(10 ** 8, 10 ** 9 - 1),
+        name=rng.choice(TOOL_NAMES), last4=f"{rng.randint(0, 9999):04d}")
+    return {"query": query, "intent": intent, "source": None, "answer": None}
+
+def generate_documents(output_dir, start, stop, seed, queries_per_doc):
+    """Write corpus documents start..stop-1; returns their labelled knowledge-base queries.
+
+    Each document draws from its own seeded generator, so the corpus is the
+    same whatever the number of workers.
+    """
+    queries = []
+    for index in range(start, stop):
+        rng = random.Random(seed * 1000003 + index)
+        kind, prefix, build = CORPUS_DOCUMENTS[index % len(CORPUS_DOCUMENTS)]
+        filename = f"{kind}_{index:06d}.pdf"
+        title, lines, questions = build(rng, f"{prefix}-{index:06d}")
+        write_pdf(os.path.join(output_dir, filename), title, lines)
+        queries += [{"query": question, "intent": "knowledge_base", "source": filename, "answer": answer}
+                    for question, answer in rng.sample(questions, min(queries_per_doc, len(questions)))]
+    return queries
+
+def generate_corpus(documents, output_dir=CORPUS_DIR, workers=None, seed=0, queries_per_doc=2,
+                    tool_query_ratio=0.25, queries_file=None):
+    """Write ``documents`` randomized policy PDFs across worker processes plus a labelled query set.
+
+    The query set is JSONL of {"query", "intent", "source", "answer"}:
+    knowledge-base queries name their source PDF and a string the relevant
+    chunk contains; about ``tool_query_ratio`` of the queries are tool
+    intents with no source. Returns the query file's path.
+    """
+    if not 0 <= tool_query_ratio < 1:
+        raise ValueError("tool_query_ratio must be in [0, 1)")
+    os.makedirs(output_dir, exist_ok=True)
+    queries_file = queries_file or os.path.join(output_dir, "queries.jsonl")
+    tasks = [(output_dir, start, min(start + CORPUS_TASK_SIZE, documents), seed, queries_per_doc)
+             for start in range(0, documents, CORPUS_TASK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        results = [generate_documents(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(generate_documents, *zip(*tasks)))
+
+    rng = random.Random(seed)
+    queries = [query for batch in results for query in batch]
+    queries += [tool_query(rng) for _ in range(round(len(queries) * tool_query_ratio / (1 - tool_query_ratio)))]
+    rng.shuffle(queries)
+    with open(queries_file, "w") as f:
+        f.writelines(json.dumps(query) + "\n" for query in queries)
+    print(f"Generated {documents} documents in {output_dir} and {len(queries)} labelled queries in {queries_file}")
+    return queries_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the banking policy PDFs")
+    parser.add_argument("--documents", type=int, default=0,
+                        help="write a synthetic corpus of this many PDFs instead of the three sample files")
+    parser.add_argument("--output", default=CORPUS_DIR, help="corpus directory")
+    parser.add_argument("--workers", type=int, default=None, help="generator processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries-per-doc", type=int, default=2, help="labelled knowledge-base queries per PDF")
+    parser.add_argument("--tool-query-ratio", type=float, default=0.25,
+                        help="share of the query set that targets banking tools instead of documents")
+    args = parser.parse_args()
+    if not args.documents:
+        generate_data()
+        return
+    generate_corpus(args.documents, args.output, args.workers, args.seed, args.queries_per_doc,
+                    args.tool_query_ratio)
+
 if __name__ == "__main__":
-    generate_data()
+    main()
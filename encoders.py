@@ -0,0 +1,46 @@
+import platform
+
+# Any object with SentenceTransformer's ``encode(texts, batch_size=..., normalize_embeddings=...)``
+# can be passed to BankRAG as its encoder; these are the built-in backends.
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Dynamically quantized exports published with the sentence-transformers models
+ONNX_INT8_FILES = {
+    "arm64": "onnx/model_qint8_arm64.onnx",
+    "aarch64": "onnx/model_qint8_arm64.onnx",
+}
+ONNX_INT8_DEFAULT_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+def load_encoder(model_name, backend="torch", threads=None):
+    """Load a sentence embedding model on one of ENCODER_BACKENDS.
+
+    "torch" is the fp32 PyTorch model. "onnx" runs the same weights on
+    ONNX Runtime, and "onnx-int8" runs the dynamically quantized int8 export.
+    Both need ``pip install "sentence-transformers[onnx]"``. ``threads`` caps
+    the intra-op threads of the backend (None keeps its default).
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}'; expected one of {', '.join(ENCODER_BACKENDS)}")
+
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError(f"Encoder backend '{backend}' needs ONNX Runtime: "
+                           f'pip install "sentence-transformers[onnx]"')
+    model_kwargs = {}
+    if threads:
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        model_kwargs["session_options"] = options
+    if backend == "onnx-int8":
+        model_kwargs["file_name"] = ONNX_INT8_FILES.get(platform.machine().lower(), ONNX_INT8_DEFAULT_FILE)
+    return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
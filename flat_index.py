@@ -0,0 +1,236 @@
+import os
+import json
+import mmap
+import shutil
+import threading
+import numpy as np
+
+# Rows scored per matmul, so float16 vectors are upcast a block at a time
+SEARCH_BLOCK_ROWS = 8192
+
+
+class FlatCollection:
+    """Vectors, IDs and metadata of one collection.
+
+    On disk: ``vectors.npy`` (normalized, float32 or float16), ``ids.npy``
+    (int64), ``meta.bin`` (one JSON [text, source] record per row) and
+    ``offsets.npy`` (n + 1 byte offsets into meta.bin). Files are memory-mapped
+    read-only, so processes serving the same index share one page-cached copy.
+    Edits are held in memory until ``save()`` rewrites the files.
+    """
+
+    def __init__(self, path, dimension, dtype):
+        self.path = path
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, dimension), dtype=self.dtype)
+        self._meta = b""
+        self._offsets = np.zeros(1, dtype=np.int64)
+        # Materialized [text, source] records once the collection has been edited
+        self._records = None
+        self._rows = {}
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, "collection.json"), "r") as f:
+            info = json.load(f)
+        collection = cls(path, info["dimension"], info["dtype"])
+        if info["count"]:
+            collection.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+            collection.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            collection._offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+            with open(os.path.join(path, "meta.bin"), "rb") as f:
+                collection._meta = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        collection._rows = {int(chunk_id): row for row, chunk_id in enumerate(collection.ids)}
+        return collection
+
+    def __len__(self):
+        return len(self.ids)
+
+    def record(self, row):
+        return self._record(self._records, self._meta, self._offsets, row)
+
+    @staticmethod
+    def _record(records, meta, offsets, row):
+        if records is not None:
+            return records[row]
+        return json.loads(meta[offsets[row]:offsets[row + 1]])
+
+    def _materialize(self):
+        """Copy the mapped files into memory before the first edit"""
+        if self._records is None:
+            self._records = [self.record(row) for row in range(len(self))]
+            self.ids = np.array(self.ids)
+            self.vectors = np.array(self.vectors)
+
+    def upsert(self, rows):
+        self._materialize()
+        ids = [int(row["id"]) for row in rows]
+        vectors = np.asarray([row["vector"] for row in rows], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        vectors = vectors.astype(self.dtype)
+        appended = []
+        for chunk_id, vector, row in zip(ids, vectors, rows):
+            index = self._rows.get(chunk_id)
+            if index is None:
+                appended.append((chunk_id, vector, [row["text"], row["source"]]))
+            else:
+                self.vectors[index] = vector
+                self._records[index] = [row["text"], row["source"]]
+        if appended:
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, np.array([a[0] for a in appended], dtype=np.int64)])
+            self.vectors = np.concatenate([self.vectors, np.stack([a[1] for a in appended])])
+            self._records.extend(a[2] for a in appended)
+            for offset, (chunk_id, _, _) in enumerate(appended):
+                self._rows[chunk_id] = start + offset
+
+    def delete(self, ids):
+        self._materialize()
+        doomed = {self._rows[int(chunk_id)] for chunk_id in ids if int(chunk_id) in self._rows}
+        if not doomed:
+            return
+        keep = np.array([row not in doomed for row in range(len(self.ids))], dtype=bool)
+        self.ids = self.ids[keep]
+        self.vectors = self.vectors[keep]
+        self._records = [record for record, kept in zip(self._records, keep) if kept]
+        self._rows = {int(chunk_id): row for row, chunk_id in enumerate(self.ids)}
+
+    def save(self):
+        """Write the collection atomically (each file via a temp file + rename) and remap it"""
+        if self._records is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        encoded = [json.dumps(record).encode("utf-8") for record in self._records]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(e) for e in encoded])
+
+        def write(name, writer):
+            tmp_file = os.path.join(self.path, f"{name}.tmp")
+            with open(tmp_file, "wb") as f:
+                writer(f)
+            os.replace(tmp_file, os.path.join(self.path, name))
+
+        write("ids.npy", lambda f: np.save(f, self.ids))
+        write("vectors.npy", lambda f: np.save(f, self.vectors))
+        write("offsets.npy", lambda f: np.save(f, offsets))
+        write("meta.bin", lambda f: f.write(b"".join(encoded)))
+        info = {"dimension": self.dimension, "dtype": self.dtype.name, "count": len(self.ids)}
+        write("collection.json", lambda f: f.write(json.dumps(info).encode("utf-8")))
+        reopened = FlatCollection.open(self.path)
+        self.__dict__.update(reopened.__dict__)
+
+    def snapshot(self):
+        """The arrays a search reads; edits replace rather than resize them, so this stays consistent"""
+        return self.ids, self.vectors, self._records, self._meta, self._offsets
+
+    def search(self, queries, limit, snapshot=None, with_vectors=False):
+        """Top ``limit`` (id, score, text, source, vector) hits by cosine similarity for each query.
+
+        ``vector`` is the stored unit vector as float32 with ``with_vectors``, else None.
+        """
+        ids, vectors, records, meta, offsets = snapshot or self.snapshot()
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        n = len(ids)
+        k = min(limit, n)
+        if k == 0:
+            return [[] for _ in queries]
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        if k < n:
+            rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            rows = np.tile(np.arange(n), (len(queries), 1))
+        top = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-top, axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return [[(int(ids[row]), float(score), *self._record(records, meta, offsets, row),
+                  np.asarray(vectors[row], dtype=np.float32) if with_vectors else None)
+                 for row, score in zip(query_rows, query_scores)]
+                for query_rows, query_scores in zip(rows, top)]
+
+
+class FlatVectorStore:
+    """In-process exact vector store over memory-mapped NumPy files.
+
+    Implements the part of ``pymilvus.MilvusClient`` that BankRAG uses, so it
+    can replace Milvus Lite without changes to ingest or retrieval. Scores are
+    cosine similarities, as with Milvus' default COSINE metric. Call
+    ``save(collection_name)`` after an ingest to persist it.
+    """
+
+    def __init__(self, path, dtype="float32", read_only=False):
+        self.path = path
+        self.dtype = dtype
+        self.read_only = read_only
+        self._collections = {}
+        self._lock = threading.RLock()
+
+    def _collection_path(self, collection_name):
+        return os.path.join(self.path, collection_name)
+
+    def _collection(self, collection_name):
+        with self._lock:
+            if collection_name not in self._collections:
+                self._collections[collection_name] = FlatCollection.open(self._collection_path(collection_name))
+            return self._collections[collection_name]
+
+    def has_collection(self, collection_name):
+        return collection_name in self._collections or \
+            os.path.exists(os.path.join(self._collection_path(collection_name), "collection.json"))
+
+    def drop_collection(self, collection_name):
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            shutil.rmtree(self._collection_path(collection_name), ignore_errors=True)
+
+    def create_collection(self, collection_name, dimension, **kwargs):
+        with self._lock:
+            collection = FlatCollection(self._collection_path(collection_name), dimension, self.dtype)
+            collection._records = []
+            collection.save()
+            self._collections[collection_name] = collection
+
+    def upsert(self, collection_name, data):
+        with self._lock:
+            self._collection(collection_name).upsert(data)
+
+    def delete(self, collection_name, ids):
+        with self._lock:
+            self._collection(collection_name).delete(ids)
+
+    def save(self, collection_name):
+        if self.read_only:
+            return
+        with self._lock:
+            self._collection(collection_name).save()
+
+    def get(self, collection_name, ids, output_fields=None):
+        collection = self._collection(collection_name)
+        results = []
+        for chunk_id in ids:
+            row = collection._rows.get(int(chunk_id))
+            if row is not None:
+                text, source = collection.record(row)
+                result = {"id": int(chunk_id), "text": text, "source": source}
+                if output_fields and "vector" in output_fields:
+                    result["vector"] = np.asarray(collection.vectors[row], dtype=np.float32)
+                results.append(result)
+        return results
+
+    def search(self, collection_name, data, limit=10, output_fields=None):
+        """Milvus-shaped results: a list per query of {"id", "distance", "entity"} hits"""
+        collection = self._collection(collection_name)
+        # Only the snapshot is taken under the lock; the matmul runs unlocked
+        with self._lock:
+            snapshot = collection.snapshot()
+        with_vectors = bool(output_fields) and "vector" in output_fields
+        return [[{"id": chunk_id, "distance": score,
+                  "entity": {"text": text, "source": source, **({"vector": vector} if with_vectors else {})}}
+                 for chunk_id, score, text, source, vector in hits]
+                for hits in collection.search(data, limit, snapshot, with_vectors)]
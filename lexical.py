@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.$%][a-z0-9]+)*")
+
+
+def tokenize(text):
+    """Lowercase word/number tokens; keeps codes like "ein" and amounts like "2.50" intact"""
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring over RAG chunks"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # chunk_id -> (text, source, length)
+        self._docs = {}
+        # term -> {chunk_id: term frequency}
+        self._postings = defaultdict(dict)
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._docs
+
+    def ids(self):
+        return set(self._docs)
+
+    def add(self, chunk_id, text, source):
+        with self._lock:
+            if chunk_id in self._docs:
+                self.remove(chunk_id)
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._docs[chunk_id] = (text, source, length)
+            self._total_length += length
+            for term, tf in counts.items():
+                self._postings[term][chunk_id] = tf
+
+    def remove(self, chunk_id):
+        with self._lock:
+            doc = self._docs.pop(chunk_id, None)
+            if doc is None:
+                return
+            self._total_length -= doc[2]
+            for term in set(tokenize(doc[0])):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def search(self, query, top_k=10):
+        """Top chunks as dicts with id, text, source and BM25 score"""
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    length = self._docs[chunk_id][2]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [{"id": chunk_id, "text": self._docs[chunk_id][0], "source": self._docs[chunk_id][1],
+                     "score": score} for chunk_id, score in best]
+
+    def save(self, path):
+        """Persist chunk texts; postings are rebuilt on load"""
+        with self._lock:
+            data = {str(chunk_id): [text, source] for chunk_id, (text, source, _) in self._docs.items()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        index = cls(**kwargs)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return index
+        for chunk_id, (text, source) in data.items():
+            index.add(int(chunk_id), text, source)
+        return index
+
+
+def reciprocal_rank_fusion(result_lists, top_k, k=60):
+    """Fuse ranked hit lists by summing 1 / (k + rank) per chunk ID"""
+    fused = {}
+    scores = defaultdict(float)
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            scores[hit["id"]] += 1.0 / (k + rank)
+            fused.setdefault(hit["id"], hit)
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [{**fused[chunk_id], "score": score} for chunk_id, score in best]
@@ -0,0 +1,366 @@
+import time
+import random
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import httpx
+from metrics import LLM_HTTP_EVENTS
+
+# Worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """The LLM upstream is failing; calls fail fast until the breaker resets"""
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """A call, including its retries, ran past its deadline"""
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive upstream failures.
+
+    While open, calls are rejected. Every ``reset_timeout`` seconds one call
+    is let through as a trial: success closes the breaker, failure keeps it open.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: this call is the trial; the next one waits another reset_timeout
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.threshold and self._failures >= self.threshold:
+                if self._opened_at is None:
+                    LLM_HTTP_EVENTS.labels(event="breaker_opened").inc()
+                self._opened_at = time.monotonic()
+
+
+class _PermitStream(httpx.SyncByteStream):
+    """Response body that gives back its in-flight permit when closed, so streamed calls stay counted"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class _AsyncPermitStream(httpx.AsyncByteStream):
+    """Async counterpart of _PermitStream"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class _Resilience:
+    """Retry, deadline and hedging policy shared by the sync and async transports"""
+
+    def __init__(self, transport, breaker=None, deadline=90.0, max_retries=2, backoff_base=0.25,
+                 backoff_max=8.0, hedge_after=None, max_in_flight=64, queue_timeout=10.0):
+        self.transport = transport
+        self.breaker = breaker or CircuitBreaker()
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Send a second copy of a request still unanswered after this many seconds (None disables)
+        self.hedge_after = hedge_after
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+
+    def _check_breaker(self, request):
+        if not self.breaker.allow():
+            LLM_HTTP_EVENTS.labels(event="breaker_rejected").inc()
+            raise CircuitOpenError("LLM circuit breaker is open", request=request)
+
+    def _record(self, response=None, error=None):
+        """Feed an attempt's outcome to the breaker; True if it is worth retrying"""
+        if error is not None or response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return error is not None or response.status_code in RETRY_STATUSES
+
+    def _retry_delay(self, attempt, response):
+        """Full-jitter exponential backoff, or the server's Retry-After when it sends one"""
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(self.backoff_max, float(retry_after))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _clip_timeouts(request, remaining):
+        """Per-attempt timeouts never run past the call's deadline"""
+        timeouts = dict(request.extensions.get("timeout") or {})
+        for key in ("connect", "read", "write", "pool"):
+            timeouts[key] = remaining if timeouts.get(key) is None else min(timeouts[key], remaining)
+        request.extensions = {**request.extensions, "timeout": timeouts}
+
+    @staticmethod
+    def _is_success(response):
+        return response.status_code not in RETRY_STATUSES
+
+
+class ResilientTransport(_Resilience, httpx.BaseTransport):
+    """httpx transport adding deadlines, retries, hedging, a concurrency limit and a circuit breaker"""
+
+    def __init__(self, transport, **kwargs):
+        super().__init__(transport, **kwargs)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight) if self.max_in_flight else None
+        # With hedging every attempt runs in this pool so a slow one can be raced
+        self._hedge_pool = ThreadPoolExecutor(max_workers=2 * (self.max_in_flight or 16),
+                                              thread_name_prefix="llm-hedge") if self.hedge_after else None
+
+    def handle_request(self, request):
+        if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+            LLM_HTTP_EVENTS.labels(event="limiter_rejected").inc()
+            raise httpx.PoolTimeout(f"More than {self.max_in_flight} LLM calls in flight", request=request)
+        try:
+            response = self._send(request, time.monotonic() + self.deadline)
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        # The permit is held until the body is read or the stream is closed
+        if self._slots is not None:
+            if response.is_closed:
+                self._slots.release()
+            else:
+                response.stream = _PermitStream(response.stream, self._slots.release)
+        return response
+
+    def _send(self, request, deadline):
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                LLM_HTTP_EVENTS.labels(event="deadline_exceeded").inc()
+                raise DeadlineExceeded(f"LLM call exceeded its {self.deadline}s deadline", request=request)
+            self._check_breaker(request)
+            self._clip_timeouts(request, remaining)
+            response = error = None
+            try:
+                response = self._attempt(request)
+            except httpx.TransportError as e:
+                error = e
+            if not self._record(response, error) or attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                response.close()
+            if time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                LLM_HTTP_EVENTS.labels(event="deadline_exceeded").inc()
+                raise DeadlineExceeded(f"LLM call exceeded its {self.deadline}s deadline", request=request)
+            LLM_HTTP_EVENTS.labels(event="retry").inc()
+            time.sleep(delay)
+
+    def _attempt(self, request):
+        if self._hedge_pool is None:
+            return self.transport.handle_request(request)
+        first = self._hedge_pool.submit(self.transport.handle_request, request)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        LLM_HTTP_EVENTS.labels(event="hedge").inc()
+        hedge = self._hedge_pool.submit(self.transport.handle_request, request)
+        pending = {first, hedge}
+        winner, failed = None, []
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if winner is None and future.exception() is None and self._is_success(future.result()):
+                    winner = future
+                else:
+                    failed.append(future)
+        if winner is None:
+            # Both attempts failed; report the later one
+            winner = failed.pop()
+        elif winner is hedge:
+            LLM_HTTP_EVENTS.labels(event="hedge_won").inc()
+        for future in failed:
+            _close_response(future)
+        # Threads cannot be cancelled; close the loser's response when it arrives
+        for future in pending:
+            future.add_done_callback(_close_response)
+        return winner.result()
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.transport.close()
+
+
+class AsyncResilientTransport(_Resilience, httpx.AsyncBaseTransport):
+    """Async counterpart of ResilientTransport; losing hedged attempts are cancelled"""
+
+    def __init__(self, transport, **kwargs):
+        super().__init__(transport, **kwargs)
+        # asyncio primitives belong to one event loop
+        self._slots = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._slots:
+            self._slots[loop] = asyncio.Semaphore(self.max_in_flight)
+        return self._slots[loop]
+
+    async def handle_async_request(self, request):
+        slots = self._semaphore() if self.max_in_flight else None
+        if slots is not None:
+            try:
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                LLM_HTTP_EVENTS.labels(event="limiter_rejected").inc()
+                raise httpx.PoolTimeout(f"More than {self.max_in_flight} LLM calls in flight", request=request)
+        try:
+            response = await asyncio.wait_for(self._send(request, time.monotonic() + self.deadline), self.deadline)
+        except BaseException as e:
+            if slots is not None:
+                slots.release()
+            if isinstance(e, asyncio.TimeoutError):
+                LLM_HTTP_EVENTS.labels(event="deadline_exceeded").inc()
+                raise DeadlineExceeded(f"LLM call exceeded its {self.deadline}s deadline", request=request)
+            raise
+        # The permit is held until the body is read or the stream is closed
+        if slots is not None:
+            if response.is_closed:
+                slots.release()
+            else:
+                response.stream = _AsyncPermitStream(response.stream, slots.release)
+        return response
+
+    async def _send(self, request, deadline):
+        for attempt in range(self.max_retries + 1):
+            self._check_breaker(request)
+            self._clip_timeouts(request, max(0.001, deadline - time.monotonic()))
+            response = error = None
+            try:
+                response = await self._attempt(request)
+            except httpx.TransportError as e:
+                error = e
+            if not self._record(response, error) or attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                await response.aclose()
+            if time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                raise asyncio.TimeoutError()
+            LLM_HTTP_EVENTS.labels(event="retry").inc()
+            await asyncio.sleep(delay)
+
+    async def _attempt(self, request):
+        if self.hedge_after is None:
+            return await self.transport.handle_async_request(request)
+        first = asyncio.ensure_future(self.transport.handle_async_request(request))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        LLM_HTTP_EVENTS.labels(event="hedge").inc()
+        hedge = asyncio.ensure_future(self.transport.handle_async_request(request))
+        pending = {first, hedge}
+        winner, failed = None, []
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if winner is None and task.exception() is None and self._is_success(task.result()):
+                        winner = task
+                    else:
+                        failed.append(task)
+        finally:
+            for task in pending:
+                task.cancel()
+        if winner is None:
+            # Both attempts failed; report the later one
+            winner = failed.pop()
+        elif winner is hedge:
+            LLM_HTTP_EVENTS.labels(event="hedge_won").inc()
+        for task in failed:
+            if task.exception() is None:
+                await task.result().aclose()
+        return winner.result()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def create_llm_http_clients(max_connections=100, max_keepalive=20, keepalive_expiry=30.0,
+                            connect_timeout=5.0, read_timeout=60.0, **resilience):
+    """(httpx.Client, httpx.AsyncClient) for ChatOpenAI with pooled connections and resilient transports.
+
+    Both clients share one circuit breaker; ``resilience`` takes the
+    ResilientTransport settings (deadline, max_retries, hedge_after, ...).
+    """
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                          keepalive_expiry=keepalive_expiry)
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    resilience.setdefault("breaker", CircuitBreaker())
+    http_client = httpx.Client(
+        transport=ResilientTransport(httpx.HTTPTransport(limits=limits), **resilience), timeout=timeout)
+    http_async_client = httpx.AsyncClient(
+        transport=AsyncResilientTransport(httpx.AsyncHTTPTransport(limits=limits), **resilience), timeout=timeout)
+    return http_client, http_async_client
@@ -1,6 +1,13 @@
-import logging
+import os
 import sys
-from datetime import datetime
+import json
+import time
+import queue
+import atexit
+import asyncio
+import logging
+import threading
+from metrics import current_trace_id
 
 # Configure logging
 logging.basicConfig(
@@ -14,35 +21,174 @@ logging.basicConfig(
 
 logger = logging.getLogger('BankingAssistant')
 
+_STOP = object()
+
+def _on_event_loop():
+    """True when called from a thread that is running an asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
 class AuditLogger:
-    """Logs all banking operations for compliance and security"""
-    
-    def __init__(self, log_file='audit.log'):
-        self.audit_logger = logging.getLogger('Audit')
-        handler = logging.FileHandler(log_file)
-        handler.setFormatter(logging.Formatter(
-            '%(asctime)s - AUDIT - %(message)s'
-        ))
-        self.audit_logger.addHandler(handler)
-        self.audit_logger.setLevel(logging.INFO)
-    
+    """Logs all banking operations for compliance and security.
+
+    Calls only enqueue a record; a writer thread serializes records as JSON
+    lines and writes them in batches.
+
+    durability:
+        "sync"     - fsync after every batch (group commit)
+        "interval" - fsync at most every ``flush_interval`` seconds
+        "os"       - flush to the OS only, never fsync
+    overflow (when ``max_queue`` records are pending):
+        "block" - wait up to ``block_timeout`` seconds for space, then drop;
+                  on an event loop thread it drops at once instead of stalling the loop
+        "drop"  - drop the record immediately
+    Dropped records are counted in ``stats()``.
+
+    A forked process writes to its own ``<name>.<pid><ext>`` file, so prefork
+    workers never rotate a file another process is appending to.
+    """
+
+    def __init__(self, log_file='audit.log', durability='interval', flush_interval=1.0,
+                 batch_size=512, max_queue=10000, overflow='block', block_timeout=1.0,
+                 max_bytes=50 * 1024 * 1024, backup_count=5, rotate_interval=None):
+        self.log_file = log_file
+        self._base_file = log_file
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_interval = rotate_interval
+        self.written = 0
+        self.dropped = 0
+
+        self.max_queue = max_queue
+        self._file = open(log_file, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
+        self._start_writer()
+        # Threads do not survive fork; forked API workers need their own writer and file
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.close)
+
+    def _after_fork(self):
+        root, ext = os.path.splitext(self._base_file)
+        self.log_file = f"{root}.{os.getpid()}{ext}"
+        self.written = 0
+        self.dropped = 0
+        # The parent keeps writing (and rotating) the inherited file
+        self._file.close()
+        self._file = open(self.log_file, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
+        self._start_writer()
+
+    def _start_writer(self):
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+        self._writer = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._writer.start()
+
+    def _emit(self, event, user_id, **fields):
+        record = {"ts": time.time(), "event": event, "user": user_id, **fields}
+        trace_id = current_trace_id()
+        if trace_id:
+            record["trace_id"] = trace_id
+        try:
+            if self.overflow == 'block' and not _on_event_loop():
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
     def log_query(self, query_type, query, user_id='anonymous'):
         """Log user queries"""
-        self.audit_logger.info(
-            f"USER_QUERY | User: {user_id} | Type: {query_type} | Query: {query}"
-        )
-    
+        self._emit("USER_QUERY", user_id, type=query_type, query=query)
+
     def log_action(self, action_type, details, user_id='anonymous'):
         """Log sensitive actions"""
-        self.audit_logger.info(
-            f"ACTION | User: {user_id} | Type: {action_type} | Details: {details}"
-        )
-    
+        self._emit("ACTION", user_id, type=action_type, details=details)
+
     def log_rag_retrieval(self, query, sources, user_id='anonymous'):
         """Log RAG retrievals"""
-        self.audit_logger.info(
-            f"RAG_RETRIEVAL | User: {user_id} | Query: {query} | Sources: {sources}"
-        )
+        self._emit("RAG_RETRIEVAL", user_id, query=query, sources=sources)
+
+    def _run(self):
+        while True:
+            try:
+                records = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._sync_if_due()
+                continue
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in records
+            lines = [json.dumps(r, default=str) + "\n" for r in records if r is not _STOP]
+            if lines:
+                self._rotate_if_needed()
+                self._file.write("".join(lines))
+                self._file.flush()
+                self.written += len(lines)
+                self._unsynced = True
+                if self.durability == 'sync':
+                    self._sync()
+                else:
+                    self._sync_if_due()
+            if stop:
+                self._sync()
+                self._file.close()
+                return
+
+    def _sync(self):
+        if self._unsynced and self.durability != 'os':
+            os.fsync(self._file.fileno())
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def _sync_if_due(self):
+        if self.durability == 'interval' and time.monotonic() - self._last_sync >= self.flush_interval:
+            self._sync()
+
+    def _rotate_if_needed(self):
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.rotate_interval and time.monotonic() - self._opened_at >= self.rotate_interval
+        if not (too_big or too_old):
+            return
+        self._sync()
+        self._file.close()
+        # Same naming as logging.handlers.RotatingFileHandler: audit.log.1 is the newest backup
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.log_file}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.log_file}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+        self._file = open(self.log_file, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
+
+    def close(self):
+        """Flush pending records and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped, "pending": self._queue.qsize()}
 
 # Create global audit logger instance
-audit_logger = AuditLogger()
+audit_logger = AuditLogger(
+    durability=os.getenv("AUDIT_DURABILITY", "interval"),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0")),
+    overflow=os.getenv("AUDIT_OVERFLOW", "block"),
+)
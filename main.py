@@ -1,12 +1,22 @@
 import os
+import sys
+import json
 import time
-from rag_engine import BankRAG
-from agents import Orchestrator
+import uuid
+import asyncio
+import argparse
+import contextlib
+import multiprocessing
+from itertools import islice
+from memory import create_session_memory
+from llm_transport import CircuitBreaker, create_llm_http_clients
+from metrics import REGISTRY, REQUEST_LATENCY, TIME_TO_FIRST_TOKEN, Trace, current_trace
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
+from server import serve_prefork
 
 # Initialize FastAPI app
 app = FastAPI(title="Banking AI Assistant API")
@@ -20,29 +30,137 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global orchestrator instance
+# Global orchestrator instance, set once the background warm-up finishes
 orchestrator = None
+# Warm-up progress reported by the readiness probe: starting, ready, failed or not_configured
+warmup_state = {"status": "starting", "error": None, "seconds": None}
+# Encoder loaded by the parent before forking workers (multi-worker mode only)
+preloaded_encoder = None
+
+DATA_FILES = ["data/fee_schedule.pdf", "data/KYC_requirements.pdf", "data/dispute_process.pdf"]
+
+# Batch mode: LLM calls in flight per batch, and queries per request (the CLI splits files into batches this size)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+def index_location():
+    """Milvus file or URI, or the NumPy store's directory with VECTOR_STORE=numpy"""
+    if os.getenv("VECTOR_STORE", "milvus") == "numpy":
+        return os.getenv("FLAT_INDEX_DIR", "./flat_index")
+    return os.getenv("MILVUS_DB_FILE", "./milvus_demo.db")
+
+def create_rag_engine(read_only=None):
+    """Build the RAG engine from environment configuration"""
+    # Imported here so `import main` does not pull in torch and pymilvus
+    from rag_engine import BankRAG
+    if read_only is None:
+        read_only = os.getenv("INDEX_READ_ONLY", "false").lower() == "true"
+    return BankRAG(
+        collection_name=os.getenv("COLLECTION_NAME", "banking_docs"),
+        db_file=index_location(),
+        state_dir=os.getenv("INDEX_STATE_DIR") or None,
+        persistent=os.getenv("PERSISTENT_INDEX", "true").lower() == "true",
+        embed_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+        insert_batch_size=int(os.getenv("INSERT_BATCH_SIZE", "512")),
+        ingest_workers=int(os.getenv("INGEST_WORKERS", "1")),
+        query_cache_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+        query_cache_ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+        read_only=read_only,
+        encoder=preloaded_encoder,
+        encoder_backend=os.getenv("ENCODER_BACKEND", "torch"),
+        encoder_threads=int(os.getenv("ENCODER_THREADS", "0")) or None,
+        vector_store=os.getenv("VECTOR_STORE", "milvus"),
+        vector_dtype=os.getenv("VECTOR_DTYPE", "float32"),
+        retrieval_mode=os.getenv("RETRIEVAL_MODE", "vector"),
+        hybrid_candidates=int(os.getenv("HYBRID_CANDIDATES", "20")),
+    )
+
+def create_orchestrator(rag, api_key):
+    """Build the orchestrator from environment configuration"""
+    from agents import Orchestrator
+    from tools import MockBankingBackend, ToolCache
+    return Orchestrator(
+        rag,
+        api_key,
+        answer_cache_size=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+        answer_cache_threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        router=os.getenv("ROUTER", "embedding"),
+        write_intent_confidence=float(os.getenv("ROUTER_WRITE_CONFIDENCE", "0.55")),
+        context_max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "1500")),
+        context_dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.92")),
+        llm_http_clients=create_llm_http_clients(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("LLM_READ_TIMEOUT", "60")),
+            deadline=float(os.getenv("LLM_DEADLINE", "90")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "0")) or None,
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "64")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+            breaker=CircuitBreaker(threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+                                   reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))),
+        ),
+        session_memory=create_session_memory(
+            backend=os.getenv("SESSION_BACKEND", "memory"),
+            path=os.getenv("SESSION_DB_FILE", "sessions.db"),
+            max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+            idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "3600")),
+            max_tokens=int(os.getenv("SESSION_MAX_TOKENS", "1000")),
+        ),
+        banking_backend=MockBankingBackend(latency=float(os.getenv("MOCK_BACKEND_LATENCY", "0"))),
+        tool_cache=ToolCache(
+            ttls={field: float(os.getenv(f"TOOL_{field.upper()}_TTL", default))
+                  for field, default in (("balance", "5"), ("transactions", "15"), ("details", "300"))},
+            maxsize=int(os.getenv("TOOL_CACHE_SIZE", "10000")),
+        ),
+    )
+
+def warm_up(api_key):
+    """Load the encoder, open (or build) the index and run one encode + search"""
+    global orchestrator
+    start = time.perf_counter()
+    print("[API] Initializing RAG Engine...")
+    rag = create_rag_engine()
+
+    if not rag.read_only:
+        if not all(os.path.exists(f) for f in DATA_FILES):
+            raise RuntimeError("Data files not found. Run data_gen.py first.")
+        rag.ingest_docs(DATA_FILES)
+    # Multi-worker mode opens an index built before the workers started
+    assistant = create_orchestrator(rag, api_key)
+    # Pay for first-call costs (thread pools, lazy kernels, index load) before taking traffic
+    rag.retrieve_chunks("warm-up query", top_k=1)
+    orchestrator = assistant
+    warmup_state.update(status="ready", seconds=round(time.perf_counter() - start, 3))
+    print(f"[API] AI Assistant initialized successfully in {warmup_state['seconds']}s"
+          f"{' (read-only index)' if rag.read_only else ''}")
+
+async def run_warm_up(api_key):
+    try:
+        await asyncio.to_thread(warm_up, api_key)
+    except Exception as e:
+        warmup_state.update(status="failed", error=str(e))
+        print(f"[API] WARNING: Warm-up failed: {e}")
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize AI components on startup"""
-    global orchestrator
-    
+    """Start warming up in the background so the server accepts connections right away"""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         print("[API] WARNING: OPENAI_API_KEY not set. API will return errors.")
+        warmup_state.update(status="not_configured", error="OPENAI_API_KEY not set")
         return
-    
-    print("[API] Initializing RAG Engine...")
-    rag = BankRAG()
-    
-    data_files = ["data/fee_schedule.pdf", "data/KYC_requirements.pdf", "data/dispute_process.pdf"]
-    if all(os.path.exists(f) for f in data_files):
-        rag.ingest_docs(data_files)
-        orchestrator = Orchestrator(rag, api_key)
-        print("[API] AI Assistant initialized successfully")
-    else:
-        print("[API] WARNING: Data files not found. Run data_gen.py first.")
+    app.state.warm_up = asyncio.create_task(run_warm_up(api_key))
+
+def not_ready_response():
+    """503 for AI endpoints hit before warm-up has finished (or when it failed)"""
+    if warmup_state["status"] == "starting":
+        return JSONResponse({"error": "AI service is starting up. Please retry shortly."},
+                            status_code=503, headers={"Retry-After": "5"})
+    return JSONResponse({
+        "error": "AI service not configured. Please set OPENAI_API_KEY and ensure data files exist."
+    }, status_code=503)
 
 @app.get("/")
 async def root():
@@ -53,14 +171,26 @@ async def root():
     except FileNotFoundError:
         return JSONResponse({"error": "Frontend not found"}, status_code=404)
 
+def session_id_for(request, data):
+    """Session ID from the body or X-Session-Id header; a new one if the client has none"""
+    return data.get("session_id") or request.headers.get("x-session-id") or uuid.uuid4().hex
+
+def start_trace(request, data):
+    """Opt-in tracing: an X-Trace-Id header or {"trace": true} in the body"""
+    trace_id = request.headers.get("x-trace-id")
+    if trace_id or data.get("trace"):
+        trace = Trace(trace_id)
+        current_trace.set(trace)
+        return trace
+    return None
+
 @app.post("/api/ask")
 async def ask_question(request: Request):
     """Main endpoint for AI queries"""
     if orchestrator is None:
-        return JSONResponse({
-            "error": "AI service not configured. Please set OPENAI_API_KEY and ensure data files exist."
-        }, status_code=503)
+        return not_ready_response()
     
+    start = time.perf_counter()
     try:
         data = await request.json()
         query = data.get("query", "").strip()
@@ -68,35 +198,199 @@ async def ask_question(request: Request):
         if not query:
             return JSONResponse({"error": "Query cannot be empty"}, status_code=400)
         
-        # Route query through orchestrator
-        response = orchestrator.route_query(query)
+        trace = start_trace(request, data)
+        session_id = session_id_for(request, data)
+        # Route query through orchestrator without blocking the event loop
+        response = await orchestrator.aroute_query(query, session_id)
         
-        return JSONResponse({
+        result = {
             "response": response,
+            "session_id": session_id,
             "status": "success"
-        })
+        }
+        if trace:
+            result["trace"] = trace.to_dict()
+        return JSONResponse(result, headers={"X-Trace-Id": trace.trace_id} if trace else None)
     
     except Exception as e:
         return JSONResponse({
             "error": f"Failed to process query: {str(e)}"
         }, status_code=500)
+    finally:
+        REQUEST_LATENCY.labels(endpoint="/api/ask").observe(time.perf_counter() - start)
 
-@app.get("/api/health")
-async def health_check():
-    """Health check endpoint"""
-    return JSONResponse({
-        "status": "healthy" if orchestrator else "not_initialized",
-        "ai_enabled": orchestrator is not None
-    })
+@app.post("/api/ask/stream")
+async def ask_question_stream(request: Request):
+    """Streaming variant of /api/ask using Server-Sent Events"""
+    if orchestrator is None:
+        return not_ready_response()
+
+    try:
+        data = await request.json()
+    except Exception as e:
+        return JSONResponse({"error": f"Failed to process query: {str(e)}"}, status_code=400)
+    query = data.get("query", "").strip()
+    if not query:
+        return JSONResponse({"error": "Query cannot be empty"}, status_code=400)
+    session_id = session_id_for(request, data)
+
+    async def events():
+        start = time.perf_counter()
+        first_token_at = None
+        # Started inside the generator so the trace lives in the streaming task's context
+        trace = start_trace(request, data)
+        try:
+            async for token in orchestrator.astream_query(query, session_id):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    TIME_TO_FIRST_TOKEN.observe(first_token_at - start)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            done = {
+                "done": True,
+                "session_id": session_id,
+                "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+                "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            }
+            if trace:
+                done["trace"] = trace.to_dict()
+            yield f"data: {json.dumps(done)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': f'Failed to process query: {str(e)}'})}\n\n"
+        finally:
+            REQUEST_LATENCY.labels(endpoint="/api/ask/stream").observe(time.perf_counter() - start)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def batch_item(record):
+    """{"id", "query", "session_id"} from a query string or JSON object; "error" if unusable"""
+    if isinstance(record, str):
+        record = {"query": record}
+    if not isinstance(record, dict):
+        return {"error": "Invalid batch item: expected a query string or object"}
+    query = str(record.get("query") or "").strip()
+    item = {"id": record.get("id"), "query": query, "session_id": record.get("session_id")}
+    if not query:
+        item["error"] = "Query cannot be empty"
+    return item
+
+def batch_line(line):
+    """batch_item for one JSONL line; a line that is not valid JSON is an error item"""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return {"error": f"Invalid JSON line: {e}"}
+    return batch_item(record)
+
+async def run_batch(orchestrator_batch, items, concurrency, start_index=0):
+    """Yield one result dict per batch item, in input order"""
+    valid = [item for item in items if "error" not in item]
+    answers = orchestrator_batch.abatch_queries([item["query"] for item in valid],
+                                                [item["session_id"] for item in valid], concurrency)
+    batch_error = None
+    try:
+        for index, item in enumerate(items, start_index):
+            result = {"index": index}
+            if item.get("id") is not None:
+                result["id"] = item["id"]
+            error = item.get("error")
+            if error is None:
+                if batch_error is None:
+                    try:
+                        _, response, failure = await answers.__anext__()
+                    except Exception as e:
+                        # Routing or retrieval for the whole batch failed
+                        batch_error = e
+                failure = batch_error or failure
+                if failure is None:
+                    result.update(status="success", response=response)
+                else:
+                    error = f"Failed to process query: {str(failure)}"
+            if error is not None:
+                result.update(status="error", error=error)
+            yield result
+    finally:
+        await answers.aclose()
+
+@app.post("/api/ask/batch")
+async def ask_batch(request: Request):
+    """Answer many queries at once; streams one JSON line per query, in input order.
+
+    Accepts {"queries": [...]} or a JSON list (strings or {"query", "id",
+    "session_id"} objects), or a JSONL body with one such object per line.
+    """
+    if orchestrator is None:
+        return not_ready_response()
+
+    body = (await request.body()).decode("utf-8", errors="replace")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        # Not a single JSON document, so JSONL; malformed lines become error items
+        lines = [line for line in body.splitlines() if line.strip()]
+        records, parse = lines, batch_line
+    else:
+        if isinstance(data, dict):
+            # One object is a one-line JSONL body
+            records = data["queries"] if "queries" in data else [data]
+        else:
+            records = data
+        if not isinstance(records, list) or not all(isinstance(r, (str, dict)) for r in records):
+            return JSONResponse({"error": "Batch must be an object or a list of query strings or objects"},
+                                status_code=400)
+        parse = batch_item
+    if not records:
+        return JSONResponse({"error": "Batch contains no queries"}, status_code=400)
+    if len(records) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"Batch exceeds {BATCH_MAX_ITEMS} queries"}, status_code=413)
+    items = [parse(record) for record in records]
+
+    async def lines():
+        start = time.perf_counter()
+        try:
+            async for result in run_batch(orchestrator, items, BATCH_CONCURRENCY):
+                yield json.dumps(result) + "\n"
+        finally:
+            REQUEST_LATENCY.labels(endpoint="/api/ask/batch").observe(time.perf_counter() - start)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, token counts, cache stats"""
+    body = REGISTRY.render()
+    if orchestrator is not None:
+        cache_stats = {**orchestrator.rag.cache_stats(), "answers": orchestrator.answer_cache.stats(),
+                       "tools": orchestrator.tool_cache.stats()}
+        lines = ["# HELP assistant_cache_hits_total Cache hits by cache",
+                 "# TYPE assistant_cache_hits_total counter"]
+        lines += [f'assistant_cache_hits_total{{cache="{name}"}} {stats["hits"]}' for name, stats in cache_stats.items()]
+        lines += ["# HELP assistant_cache_misses_total Cache misses by cache",
+                  "# TYPE assistant_cache_misses_total counter"]
+        lines += [f'assistant_cache_misses_total{{cache="{name}"}} {stats["misses"]}' for name, stats in cache_stats.items()]
+        body += "\n".join(lines) + "\n"
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (see /api/health/live and /api/health/ready for probes)"""
     return JSONResponse({
-        "status": "healthy" if orchestrator else "not_initialized",
+        "status": "healthy" if orchestrator else warmup_state["status"],
         "ai_enabled": orchestrator is not None
     })
 
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return JSONResponse({"status": "alive"})
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Readiness probe: 200 only once the encoder, index and orchestrator are warm"""
+    ready = orchestrator is not None
+    # pid tells multi-worker probes which worker answered
+    return JSONResponse({"ready": ready, **warmup_state, "pid": os.getpid()}, status_code=200 if ready else 503)
+
 def main():
     """CLI Demo Mode"""
     print("="*50)
@@ -119,19 +413,18 @@ def main():
 
     # 1. Initialize RAG and Ingest Data
     print("[System] Initializing RAG Engine...")
-    rag = BankRAG()
+    rag = create_rag_engine()
     
     # Check if data exists, if not wait (assuming data_gen runs separately or we run it here)
-    data_files = ["data/fee_schedule.pdf", "data/KYC_requirements.pdf", "data/dispute_process.pdf"]
-    if not all(os.path.exists(f) for f in data_files):
+    if not all(os.path.exists(f) for f in DATA_FILES):
         print("[System] Data files not found. Please run data_gen.py first.")
         return
 
-    rag.ingest_docs(data_files)
+    rag.ingest_docs(DATA_FILES)
     print("[System] RAG Initialization Complete.")
 
     # 2. Initialize Orchestrator with AI
-    orchestrator_cli = Orchestrator(rag, api_key)
+    orchestrator_cli = create_orchestrator(rag, api_key)
 
     # 3. Demo Scenarios
     scenarios = [
@@ -170,12 +463,117 @@ def main():
         print(f"Agent Response:\n{response}")
         print("-" * 30)
 
+def run_batch_file(path, output=None, concurrency=BATCH_CONCURRENCY):
+    """Answer every query in a JSONL file, writing JSONL results in input order"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("[System] ERROR: OPENAI_API_KEY is not set.")
+    if not all(os.path.exists(f) for f in DATA_FILES):
+        raise SystemExit("[System] Data files not found. Please run data_gen.py first.")
+    out = open(output, "w") if output else sys.stdout
+
+    async def answer_file(orchestrator_batch):
+        with open(path, "r") as f:
+            lines = (line for line in f if line.strip())
+            start_index = 0
+            while True:
+                records = list(islice(lines, BATCH_MAX_ITEMS))
+                if not records:
+                    break
+                async for result in run_batch(orchestrator_batch, [batch_line(r) for r in records],
+                                              concurrency, start_index):
+                    out.write(json.dumps(result) + "\n")
+                out.flush()
+                start_index += len(records)
+
+    try:
+        # Progress messages go to stderr so stdout carries only results
+        with contextlib.redirect_stdout(sys.stderr):
+            rag = create_rag_engine()
+            if not rag.read_only:
+                rag.ingest_docs(DATA_FILES)
+            asyncio.run(answer_file(create_orchestrator(rag, api_key)))
+    finally:
+        if output:
+            out.close()
+
+def ingest_index():
+    """Build step: ingest the documents into the persistent index and exit"""
+    if not all(os.path.exists(f) for f in DATA_FILES):
+        raise SystemExit("[System] Data files not found. Please run data_gen.py first.")
+    rag = create_rag_engine(read_only=False)
+    rag.ingest_docs(DATA_FILES)
+
+def serve_api(host="0.0.0.0", port=8000, workers=1, skip_ingest=False):
+    """Run the API server, forking read-only workers when workers > 1"""
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port)
+        return
+
+    db_file = index_location()
+    if os.getenv("VECTOR_STORE", "milvus") != "numpy" and db_file.endswith(".db"):
+        raise SystemExit("[API] Milvus Lite (.db file) can only be opened by one process. "
+                         "Set MILVUS_DB_FILE to a Milvus server URI or use VECTOR_STORE=numpy "
+                         "to run several workers.")
+
+    if not skip_ingest:
+        # Ingest once in a separate leader process so the parent never runs
+        # inference (torch thread pools are not fork-safe once started)
+        leader = multiprocessing.get_context("spawn").Process(target=ingest_index)
+        leader.start()
+        leader.join()
+        if leader.exitcode != 0:
+            raise SystemExit("[API] Index build failed; not starting workers.")
+
+    # Load weights once; forked workers share them copy-on-write
+    global preloaded_encoder
+    os.environ["INDEX_READ_ONLY"] = "true"
+    # Split the cores between workers instead of each using all of them
+    worker_threads = int(os.getenv("ENCODER_THREADS", "0")) or max(1, (os.cpu_count() or 1) // workers)
+    backend = os.getenv("ENCODER_BACKEND", "torch")
+    if backend == "torch":
+        from rag_engine import load_encoder
+        preloaded_encoder = load_encoder()
+    else:
+        # ONNX Runtime sessions do not survive fork; each worker loads its own
+        os.environ["ENCODER_THREADS"] = str(worker_threads)
+
+    def configure_worker(index):
+        if backend == "torch":
+            import torch
+            torch.set_num_threads(worker_threads)
+
+    def stop_worker(index):
+        # Workers exit without running atexit handlers; write out queued audit records
+        from logger import audit_logger
+        audit_logger.close()
+
+    serve_prefork(app, host=host, port=port, workers=workers, on_worker_start=configure_worker,
+                  on_worker_exit=stop_worker)
+
 if __name__ == "__main__":
-    import sys
-    
-    # Check if running as API server or CLI demo
-    if len(sys.argv) > 1 and sys.argv[1] == "--api":
+    parser = argparse.ArgumentParser(description="Banking AI Assistant")
+    parser.add_argument("--api", action="store_true", help="run the API server instead of the CLI demo")
+    parser.add_argument("--ingest", action="store_true", help="build the persistent index and exit")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="API worker processes (requires a Milvus server URI when > 1)")
+    parser.add_argument("--skip-ingest", action="store_true",
+                        help="with --workers > 1, serve an index already built by --ingest")
+    parser.add_argument("--batch", metavar="FILE", help="answer every query in a JSONL file and exit")
+    parser.add_argument("--batch-output", metavar="FILE", help="write batch results here instead of stdout")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="LLM calls in flight in batch mode")
+    args = parser.parse_args()
+
+    # Check if running as API server, build step, batch job or CLI demo
+    if args.ingest:
+        ingest_index()
+    elif args.batch:
+        run_batch_file(args.batch, args.batch_output, args.concurrency)
+    elif args.api:
         print("Starting API Server...")
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        serve_api(host=args.host, port=args.port, workers=args.workers, skip_ingest=args.skip_ingest)
     else:
         main()
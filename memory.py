@@ -0,0 +1,197 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_core.messages import AIMessage, HumanMessage
+
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text):
+    """Token count with tiktoken's cl100k_base, or a ~4 chars/token estimate if unavailable"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def truncate_tokens(text, max_tokens):
+    """The longest prefix of text that fits in max_tokens"""
+    encoding = _get_encoding()
+    if not encoding:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text)
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def _trim(messages, max_tokens):
+    """Drop the oldest messages until the total fits in max_tokens"""
+    total = sum(tokens for _, _, tokens in messages)
+    while messages and total > max_tokens:
+        total -= messages.pop(0)[2]
+    return messages
+
+
+class InMemorySessionStore:
+    """Session histories held in RAM; idle and least recently used sessions are evicted"""
+
+    def __init__(self, max_sessions=10000, idle_ttl=3600.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # session_id -> (last_used, [(role, content, tokens), ...]), in LRU order
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if time.monotonic() - entry[0] > self.idle_ttl:
+                del self._sessions[session_id]
+                return []
+            return list(entry[1])
+
+    def append(self, session_id, messages, max_tokens):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[1] if entry else []
+            self._sessions[session_id] = (time.monotonic(), _trim(history + messages, max_tokens))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Session histories in a SQLite file, so they survive restarts without living in RAM.
+
+    Eviction runs every ``evict_every`` appends rather than on each one, so
+    the store may briefly hold up to that many sessions over ``max_sessions``.
+    """
+
+    def __init__(self, path="sessions.db", max_sessions=100000, idle_ttl=86400.0, evict_every=256):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evict_every = evict_every
+        self._appends = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_used REAL NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, tokens INTEGER NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT last_used FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None or time.time() - row[0] > self.idle_ttl:
+                return []
+            return self._conn.execute(
+                "SELECT role, content, tokens FROM messages WHERE session_id = ? ORDER BY id",
+                (session_id,)).fetchall()
+
+    def append(self, session_id, messages, max_tokens):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT INTO sessions (session_id, last_used) VALUES (?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET last_used = excluded.last_used",
+                    (session_id, time.time()))
+                self._conn.executemany(
+                    "INSERT INTO messages (session_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+                    [(session_id, role, content, tokens) for role, content, tokens in messages])
+                rows = self._conn.execute(
+                    "SELECT id, tokens FROM messages WHERE session_id = ? ORDER BY id DESC",
+                    (session_id,)).fetchall()
+                total, keep_from = 0, None
+                for message_id, tokens in rows:
+                    if total + tokens > max_tokens:
+                        break
+                    total += tokens
+                    keep_from = message_id
+                if keep_from is None:
+                    self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                else:
+                    self._conn.execute("DELETE FROM messages WHERE session_id = ? AND id < ?",
+                                       (session_id, keep_from))
+                self._appends += 1
+                if self._appends % self.evict_every == 0:
+                    self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        """Remove idle sessions and the least recently used ones beyond max_sessions"""
+        # Both lookups walk the last_used index from the oldest end
+        cutoff = time.time() - self.idle_ttl
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT session_id FROM sessions WHERE last_used < ?", (cutoff,))]
+        excess = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(evicted) - self.max_sessions
+        if excess > 0:
+            evicted += [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM sessions WHERE last_used >= ? ORDER BY last_used LIMIT ?", (cutoff, excess))]
+        ids = [(session_id,) for session_id in evicted]
+        self._conn.executemany("DELETE FROM messages WHERE session_id = ?", ids)
+        self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", ids)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionMemory:
+    """Per-session conversation history kept within a token budget.
+
+    Only the most recent messages that fit in ``max_tokens`` are kept, so the
+    history added to agent prompts stays a flat size however long a session runs.
+    """
+
+    def __init__(self, store=None, max_tokens=1000):
+        self.store = store if store is not None else InMemorySessionStore()
+        self.max_tokens = max_tokens
+
+    def history(self, session_id):
+        """LangChain messages for a session (empty without a session ID)"""
+        if not session_id:
+            return []
+        return [HumanMessage(content=content) if role == "human" else AIMessage(content=content)
+                for role, content, _ in self.store.load(session_id)]
+
+    def add_turn(self, session_id, query, response):
+        if not session_id:
+            return
+        self.store.append(session_id, [
+            ("human", query, count_tokens(query)),
+            ("ai", response, count_tokens(response)),
+        ], self.max_tokens)
+
+
+def create_session_memory(backend="memory", path="sessions.db", max_sessions=10000,
+                          idle_ttl=3600.0, max_tokens=1000):
+    """SessionMemory with an in-memory ("memory") or SQLite ("sqlite") store"""
+    if backend == "sqlite":
+        store = SQLiteSessionStore(path, max_sessions=max_sessions, idle_ttl=idle_ttl)
+    else:
+        store = InMemorySessionStore(max_sessions=max_sessions, idle_ttl=idle_ttl)
+    return SessionMemory(store, max_tokens=max_tokens)
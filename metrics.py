@@ -0,0 +1,270 @@
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_string(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _with_le(labels, bound):
+    return _label_string(labels + (("le", bound),))
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram for one label set"""
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS, labels=()):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            cumulative = 0
+            for bound, count in zip(self.buckets, self._counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_with_le(self.labels, bound)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_with_le(self.labels, '+Inf')} {self._count}")
+            lines.append(f"{self.name}_sum{_label_string(self.labels)} {self._sum}")
+            lines.append(f"{self.name}_count{_label_string(self.labels)} {self._count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter for one label set"""
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self):
+        return [f"{self.name}{_label_string(self.labels)} {self._value}"]
+
+
+class MetricFamily:
+    """A named metric with one child per label set"""
+
+    def __init__(self, kind, name, description, factory):
+        self.kind = kind
+        self.name = name
+        self.description = description
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = self._factory(key)
+            return self._children[key]
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.values())
+        for child in children:
+            lines.extend(child.render())
+        return "\n".join(lines)
+
+
+class Registry:
+    """Holds named metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _family(self, kind, name, description, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = MetricFamily(kind, name, description, factory)
+            return self._metrics[name]
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._family("histogram", name, description, lambda labels: Histogram(name, buckets, labels))
+
+    def counter(self, name, description):
+        return self._family("counter", name, description, lambda labels: Counter(name, labels))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "assistant_time_to_first_token_seconds",
+    "Time from request start to the first streamed response token",
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "assistant_request_seconds",
+    "End-to-end request latency by endpoint",
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    "assistant_stage_seconds",
+    "Latency of request stages (routing, query_embedding, vector_search, lexical_search, context_assembly, prompt_format, llm, tool_call)",
+)
+LLM_TOKENS = REGISTRY.counter(
+    "assistant_llm_tokens_total",
+    "Tokens reported by LLM responses, by type (prompt/completion)",
+)
+CONTEXT_TOKENS = REGISTRY.counter(
+    "assistant_context_tokens_total",
+    "RAG context tokens by stage (retrieved: before assembly, sent: after merging, dedup and budgeting)",
+)
+LLM_HTTP_EVENTS = REGISTRY.counter(
+    "assistant_llm_http_events_total",
+    "LLM transport events (retry, hedge, hedge_won, deadline_exceeded, limiter_rejected, breaker_opened, breaker_rejected)",
+)
+
+
+class Trace:
+    """Per-request trace: an ID plus the time spent in each stage"""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.stages = {}
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.attributes = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            "tokens": dict(self.tokens),
+            **self.attributes,
+        }
+
+
+# Opt-in: only set while a traced request is being handled
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace_id():
+    trace = current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def annotate(key, value):
+    """Attach a value (e.g. the routed intent) to the current trace, if any"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+def record_stage(stage, seconds):
+    STAGE_LATENCY.labels(stage=stage).observe(seconds)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as a request stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Times prompt formatting and LLM calls inside LCEL chains and counts tokens"""
+
+    # Run in the caller's thread/task so the current trace is visible
+    run_inline = True
+
+    def __init__(self):
+        self._starts = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        if kwargs.get("run_type") == "prompt":
+            self._starts[run_id] = ("prompt_format", time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = ("llm", time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = ("llm", time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        LLM_TOKENS.labels(type="prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(type="completion").inc(completion_tokens)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.tokens["prompt"] += prompt_tokens
+            trace.tokens["completion"] += completion_tokens
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+    def _finish(self, run_id):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            stage, start = started
+            record_stage(stage, time.perf_counter() - start)
+
+
+def _token_usage(response):
+    """(prompt, completion) token counts from an LLMResult"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens", 0)
+            completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+llm_metrics_callback = LLMMetricsCallback()
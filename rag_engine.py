@@ -1,58 +1,472 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-from pymilvus import MilvusClient
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
 import numpy as np
+from cache import TTLCache, normalize_query
+from metrics import timed
+from lexical import BM25Index, reciprocal_rank_fusion
+import encoders
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+MANIFEST_VERSION = 1
+# Where the manifest and BM25 sidecar of an index on a Milvus server are kept
+DEFAULT_STATE_DIR = "./index_state"
+
+
+def load_encoder(backend="torch", threads=None):
+    """Load the sentence embedding model on a backend from encoders.ENCODER_BACKENDS.
+
+    Multi-worker serving calls this before forking so workers share the
+    weights copy-on-write instead of each loading their own copy.
+    """
+    # Heavy imports (torch, Milvus, PDF parsing) are deferred to first use
+    # so importing this module stays cheap
+    return encoders.load_encoder(EMBEDDING_MODEL, backend, threads)
+
+
+def _file_hash(path):
+    """SHA-256 of a file's bytes, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_id(source, chunk_hash, occurrence):
+    """Deterministic int64 primary key for a chunk of a source document"""
+    key = f"{source}\x00{chunk_hash}\x00{occurrence}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") >> 1
+
+
+def load_and_split(path):
+    """Load a PDF and split it into chunks"""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    loader = PyPDFLoader(path)
+    docs = loader.load()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(docs)
+
+
+def split_document(path, known_hash=None):
+    """Hash a PDF and split it into (chunk_id, text, source) tuples.
+
+    Returns ``None`` for the chunks when the file hash matches ``known_hash``.
+    Module-level so it can run in ingest worker processes.
+    """
+    file_hash = _file_hash(path)
+    if file_hash == known_hash:
+        return path, file_hash, None
+
+    chunks = []
+    occurrences = {}
+    for split in load_and_split(path):
+        text = split.page_content
+        chunk_hash = _chunk_hash(text)
+        occurrences[chunk_hash] = occurrences.get(chunk_hash, 0) + 1
+        chunk_id = _chunk_id(path, chunk_hash, occurrences[chunk_hash])
+        chunks.append((chunk_id, text, split.metadata.get("source", path)))
+    return path, file_hash, chunks
+
+
+def index_state_prefix(db_file, collection_name, state_dir=None):
+    """Path prefix of an index's manifest and BM25 sidecar files.
+
+    A local index keeps them next to its database file. A Milvus server URI
+    has no local path, so its state goes in ``state_dir`` (``DEFAULT_STATE_DIR``
+    unless set), one set of files per collection.
+    """
+    if state_dir or "://" in db_file:
+        return os.path.join(state_dir or DEFAULT_STATE_DIR, collection_name)
+    return db_file
+
+
+def format_context(hits):
+    """Join retrieved chunks into the knowledge-base block of the RAG prompt"""
+    retrieved_texts = []
+    for hit in hits:
+        retrieved_texts.append(f"[Source: {os.path.basename(hit['source'])}]\n{hit['text']}")
+    return "\n\n".join(retrieved_texts)
+
 
 class BankRAG:
-    def __init__(self, collection_name="banking_docs", db_file="./milvus_demo.db"):
+    def __init__(self, collection_name="banking_docs", db_file="./milvus_demo.db",
+                 persistent=False, manifest_file=None, embed_batch_size=64, insert_batch_size=512,
+                 ingest_workers=1, query_cache_size=1024, query_cache_ttl=3600.0,
+                 read_only=False, encoder=None, retrieval_mode="vector", hybrid_candidates=20,
+                 encoder_backend="torch", encoder_threads=None, vector_store="milvus", vector_dtype="float32",
+                 state_dir=None):
         self.collection_name = collection_name
-        self.client = MilvusClient(db_file)
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embed_batch_size = embed_batch_size
+        self.insert_batch_size = insert_batch_size
+        # PDF parsing and splitting run in this many processes during ingest
+        self.ingest_workers = ingest_workers
+        # Normalized query -> embedding, and (query, top_k) -> retrieved context.
+        # The context cache is cleared whenever ingest changes the index.
+        self.query_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        self.context_cache = TTLCache(maxsize=query_cache_size, ttl=query_cache_ttl)
+        # Bumped whenever ingest changes the index, so dependent caches can invalidate
+        self.index_version = 0
+        # "milvus" uses Milvus (Lite or server) at db_file; "numpy" keeps memory-mapped
+        # vectors in the db_file directory, shareable by several worker processes
+        self.vector_store = vector_store
+        self.vector_dtype = vector_dtype
+        if vector_store == "numpy":
+            from flat_index import FlatVectorStore
+            self.client = FlatVectorStore(db_file, dtype=vector_dtype, read_only=read_only)
+        else:
+            from pymilvus import MilvusClient
+            self.client = MilvusClient(db_file)
+        # A preloaded encoder must have been loaded with the same backend
+        self.encoder_backend = encoder_backend
+        self.encoder = encoder if encoder is not None else load_encoder(encoder_backend, encoder_threads)
         self.vector_dim = 384
-        
+        # Persistent mode keeps the collection across restarts and tracks
+        # what is in it with a manifest (see index_state_prefix for where)
+        self.persistent = persistent or read_only
+        # Read-only mode serves an index built elsewhere and never writes to it
+        self.read_only = read_only
+        state_prefix = index_state_prefix(db_file, collection_name, state_dir)
+        if self.persistent and not read_only:
+            os.makedirs(os.path.dirname(state_prefix) or ".", exist_ok=True)
+        self.manifest_file = manifest_file or f"{state_prefix}.manifest.json"
+        self.manifest = self._load_manifest() if self.persistent else self._empty_manifest()
+        self._open_collection(db_file)
+
+        # "hybrid" fuses vector search with an in-process BM25 index over the
+        # same chunks; each side contributes hybrid_candidates results
+        self.retrieval_mode = retrieval_mode
+        self.hybrid_candidates = hybrid_candidates
+        self.lexical_file = f"{state_prefix}.bm25.json"
+        self.lexical_index = self._open_lexical_index() if retrieval_mode == "hybrid" else None
+
+    def _open_collection(self, db_file):
+        collection_name = self.collection_name
+        read_only = self.read_only
+        index_exists = self.client.has_collection(collection_name) and self._manifest_is_current()
+        if read_only:
+            if not index_exists:
+                raise RuntimeError(f"No current index for collection '{collection_name}' in {db_file}; "
+                                   f"build it first with `python main.py --ingest`")
+            print(f"[RAG] Opened collection '{collection_name}' read-only "
+                  f"({len(self.manifest['documents'])} documents tracked)")
+            return
+
+        if self.persistent and index_exists:
+            print(f"[RAG] Reusing persistent collection '{collection_name}' "
+                  f"({len(self.manifest['documents'])} documents tracked)")
+            return
+
         if self.client.has_collection(collection_name):
             self.client.drop_collection(collection_name)
-            
+
         self.client.create_collection(
             collection_name=collection_name,
             dimension=self.vector_dim
         )
+        self.manifest = self._empty_manifest()
+        self._save_manifest()
+
+    def _save_vectors(self):
+        """Milvus persists writes itself; the NumPy store rewrites its files once per ingest"""
+        if self.vector_store == "numpy":
+            self.client.save(self.collection_name)
+
+    def _index_settings(self):
+        """Settings that invalidate every stored vector when they change"""
+        settings = {
+            "version": MANIFEST_VERSION,
+            "collection": self.collection_name,
+            "model": EMBEDDING_MODEL,
+            "dimension": self.vector_dim,
+            "chunk_size": CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP,
+        }
+        # Quantized vectors differ slightly from fp32 ones, so switching backends
+        # re-embeds; torch is left out so existing indexes stay valid
+        if self.encoder_backend != "torch":
+            settings["encoder_backend"] = self.encoder_backend
+        if self.vector_store == "numpy":
+            settings["vector_dtype"] = self.vector_dtype
+        return settings
+
+    def _empty_manifest(self):
+        return {"settings": self._index_settings(), "documents": {}}
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _manifest_is_current(self):
+        return self.manifest is not None and self.manifest.get("settings") == self._index_settings()
+
+    def _save_manifest(self):
+        if not self.persistent or self.read_only:
+            return
+        tmp_file = f"{self.manifest_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_file, self.manifest_file)
+
+    def _open_lexical_index(self):
+        """Load the BM25 sidecar and bring it in line with the chunks the manifest tracks"""
+        index = BM25Index.load(self.lexical_file) if self.persistent else BM25Index()
+        expected = {chunk_id for entry in self.manifest["documents"].values() for chunk_id in entry["chunk_ids"]}
+        stale = index.ids() - expected
+        for chunk_id in stale:
+            index.remove(chunk_id)
+        # Chunks indexed before hybrid mode was enabled are read back from Milvus
+        missing = list(expected - index.ids())
+        for i in range(0, len(missing), self.insert_batch_size):
+            rows = self.client.get(collection_name=self.collection_name,
+                                   ids=missing[i:i + self.insert_batch_size], output_fields=["text", "source"])
+            for row in rows:
+                index.add(row["id"], row["text"], row["source"])
+        if stale or missing:
+            self._save_lexical_index(index)
+        print(f"[RAG] Lexical index ready ({len(index)} chunks)")
+        return index
+
+    def _save_lexical_index(self, index):
+        if not self.persistent or self.read_only:
+            return
+        index.save(self.lexical_file)
+
+    def _split_documents(self, jobs):
+        """Yield split results for (path, known_hash) jobs, in a process pool when configured"""
+        if self.ingest_workers <= 1 or len(jobs) <= 1:
+            for path, known_hash in jobs:
+                yield split_document(path, known_hash)
+            return
+
+        # Keep a bounded number of documents in flight so parsed chunks
+        # cannot pile up faster than the embedding stage consumes them
+        max_in_flight = self.ingest_workers * 2
+        jobs = iter(jobs)
+        with ProcessPoolExecutor(max_workers=self.ingest_workers) as executor:
+            pending = {executor.submit(split_document, *job) for job in islice(jobs, max_in_flight)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    next_job = next(jobs, None)
+                    if next_job is not None:
+                        pending.add(executor.submit(split_document, *next_job))
+
+    def _pending_chunks(self, pdf_paths, stats):
+        """Yield chunks of new or changed documents that still need embedding"""
+        documents = self.manifest["documents"]
+
+        for source in [s for s in documents if s not in pdf_paths]:
+            stats["stale_ids"].extend(documents.pop(source)["chunk_ids"])
+
+        file_stats = {}
+        jobs = []
+        for path in pdf_paths:
+            stat = os.stat(path)
+            entry = documents.get(path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                stats["unchanged"] += 1
+                continue
+            file_stats[path] = stat
+            jobs.append((path, entry["sha256"] if entry else None))
+
+        for path, file_hash, chunks in self._split_documents(jobs):
+            stat = file_stats[path]
+            entry = documents.get(path)
+            if chunks is None:
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                stats["unchanged"] += 1
+                continue
+
+            indexed_ids = set(entry["chunk_ids"]) if entry else set()
+            chunk_ids = []
+            for chunk_id, text, source in chunks:
+                chunk_ids.append(chunk_id)
+                if chunk_id not in indexed_ids:
+                    yield {"id": chunk_id, "text": text, "source": source}
+            stats["stale_ids"].extend(indexed_ids.difference(chunk_ids))
+            documents[path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": file_hash, "chunk_ids": chunk_ids}
+
+    def _embed_and_insert(self, chunks):
+        """Embed one batch of chunks and upsert it into Milvus"""
+        vectors = self.encoder.encode([c["text"] for c in chunks], batch_size=self.embed_batch_size)
+        for chunk, vector in zip(chunks, vectors):
+            chunk["vector"] = vector.tolist()
+        # Upsert so a crash between insert and manifest save cannot duplicate chunks
+        self.client.upsert(collection_name=self.collection_name, data=chunks)
+        if self.lexical_index is not None:
+            for chunk in chunks:
+                self.lexical_index.add(chunk["id"], chunk["text"], chunk["source"])
 
     def ingest_docs(self, pdf_paths):
+        """Index new or changed documents and drop chunks of removed ones.
+
+        Chunks stream from the splitter into fixed-size batches, so at most
+        ``insert_batch_size`` chunks are held in memory at once.
+        """
+        if self.read_only:
+            raise RuntimeError("Cannot ingest into a read-only index")
         print("Ingesting documents...")
-        all_splits = []
-        for path in pdf_paths:
-            loader = PyPDFLoader(path)
-            docs = loader.load()
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            splits = text_splitter.split_documents(docs)
-            all_splits.extend(splits)
-            
-        data = []
-        for i, split in enumerate(all_splits):
-            text = split.page_content
-            vector = self.encoder.encode(text).tolist()
-            data.append({"id": i, "vector": vector, "text": text, "source": split.metadata.get("source", "unknown")})
-            
-        self.client.insert(collection_name=self.collection_name, data=data)
-        print(f"Ingested {len(data)} chunks into Milvus.")
+        start = time.perf_counter()
+        stats = {"chunks": 0, "unchanged": 0, "stale_ids": []}
+
+        batch = []
+        for chunk in self._pending_chunks(pdf_paths, stats):
+            batch.append(chunk)
+            if len(batch) >= self.insert_batch_size:
+                self._embed_and_insert(batch)
+                stats["chunks"] += len(batch)
+                batch = []
+        if batch:
+            self._embed_and_insert(batch)
+            stats["chunks"] += len(batch)
+
+        if stats["stale_ids"]:
+            self.client.delete(collection_name=self.collection_name, ids=stats["stale_ids"])
+            if self.lexical_index is not None:
+                for chunk_id in stats["stale_ids"]:
+                    self.lexical_index.remove(chunk_id)
+        if stats["chunks"] or stats["stale_ids"]:
+            self._save_vectors()
+        self._save_manifest()
+        if self.lexical_index is not None and (stats["chunks"] or stats["stale_ids"]):
+            self._save_lexical_index(self.lexical_index)
+        if stats["chunks"] or stats["stale_ids"]:
+            self.index_version += 1
+            self.context_cache.clear()
+
+        elapsed = time.perf_counter() - start
+        report = {
+            "chunks": stats["chunks"],
+            "unchanged_documents": stats["unchanged"],
+            "removed_chunks": len(stats["stale_ids"]),
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(stats["chunks"] / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        print(f"Ingested {report['chunks']} chunks into Milvus in {report['seconds']}s "
+              f"({report['chunks_per_sec']} chunks/sec, {report['unchanged_documents']} documents unchanged, "
+              f"{report['removed_chunks']} stale chunks removed).")
+        return report
+
+    def embed_query(self, query):
+        """Encode a query, reusing cached embeddings for repeated questions"""
+        key = normalize_query(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            # Encode the normalized form so every variant maps to the same vector
+            with timed("query_embedding"):
+                vector = self.encoder.encode(key).tolist()
+            self.query_cache.set(key, vector)
+        return vector
+
+    def embed_queries(self, queries):
+        """Encode many queries in one batched call, reusing cached embeddings"""
+        keys = [normalize_query(query) for query in queries]
+        vectors = {key: self.query_cache.get(key) for key in keys}
+        missing = list(dict.fromkeys(key for key in keys if vectors[key] is None))
+        if missing:
+            with timed("query_embedding"):
+                encoded = self.encoder.encode(missing, batch_size=self.embed_batch_size)
+            for key, vector in zip(missing, encoded):
+                vectors[key] = vector.tolist()
+                self.query_cache.set(key, vectors[key])
+        return [vectors[key] for key in keys]
+
+    def cache_stats(self):
+        return {"query_embeddings": self.query_cache.stats(), "contexts": self.context_cache.stats()}
+
+    def _vector_search_many(self, query_vectors, limit):
+        """One Milvus search for several query vectors; a hit list per vector"""
+        with timed("vector_search"):
+            results = self.client.search(
+                collection_name=self.collection_name,
+                data=query_vectors,
+                limit=limit,
+                # Stored vectors let context assembly deduplicate without re-encoding chunks
+                output_fields=["text", "source", "vector"]
+            )
+
+        return [[
+            {"id": res["id"], "text": res["entity"]["text"], "source": res["entity"]["source"], "score": res["distance"],
+             "vector": np.asarray(res["entity"]["vector"], dtype=np.float32)}
+            for res in result
+        ] for result in results]
+
+    def _vector_search(self, query, limit):
+        return self._vector_search_many([self.embed_query(query)], limit)[0]
+
+    def _fuse(self, query, vector_hits, top_k):
+        """Fuse vector candidates with BM25 results for the same query"""
+        candidates = max(top_k, self.hybrid_candidates)
+        with timed("lexical_search"):
+            lexical_hits = self.lexical_index.search(query, candidates)
+        return self._attach_vectors(reciprocal_rank_fusion([vector_hits, lexical_hits], top_k))
+
+    def _attach_vectors(self, hits):
+        """Fetch stored vectors for fused hits that only BM25 found"""
+        missing = [hit for hit in hits if "vector" not in hit]
+        if missing:
+            rows = self.client.get(collection_name=self.collection_name, ids=[hit["id"] for hit in missing],
+                                   output_fields=["vector"])
+            vectors = {row["id"]: row["vector"] for row in rows}
+            for hit in missing:
+                if hit["id"] in vectors:
+                    hit["vector"] = np.asarray(vectors[hit["id"]], dtype=np.float32)
+        return hits
+
+    def retrieve_chunks(self, query, top_k=3):
+        """Return the top_k chunks for a query as dicts with id, text, source and score.
+
+        In hybrid mode the score is the reciprocal rank fusion score of the
+        vector and BM25 rankings rather than a cosine similarity.
+        """
+        cache_key = (normalize_query(query), top_k)
+        hits = self.context_cache.get(cache_key)
+        if hits is not None:
+            return hits
+
+        if self.lexical_index is None:
+            hits = self._vector_search(query, top_k)
+        else:
+            hits = self._fuse(query, self._vector_search(query, max(top_k, self.hybrid_candidates)), top_k)
+        self.context_cache.set(cache_key, hits)
+        return hits
+
+    def retrieve_chunks_batch(self, queries, top_k=3):
+        """retrieve_chunks for many queries: one batched embedding call and one multi-vector search"""
+        cache_keys = [(normalize_query(query), top_k) for query in queries]
+        results = {key: self.context_cache.get(key) for key in cache_keys}
+        # One representative query per uncached key, so duplicates are searched once
+        pending = {}
+        for key, query in zip(cache_keys, queries):
+            if results[key] is None:
+                pending.setdefault(key, query)
+        if pending:
+            limit = top_k if self.lexical_index is None else max(top_k, self.hybrid_candidates)
+            vectors = self.embed_queries(list(pending.values()))
+            for (key, query), hits in zip(pending.items(), self._vector_search_many(vectors, limit)):
+                if self.lexical_index is not None:
+                    hits = self._fuse(query, hits, top_k)
+                results[key] = hits
+                self.context_cache.set(key, hits)
+        return [results[key] for key in cache_keys]
 
     def retrieve(self, query, top_k=3):
-        query_vector = self.encoder.encode(query).tolist()
-        results = self.client.search(
-            collection_name=self.collection_name,
-            data=[query_vector],
-            limit=top_k,
-            output_fields=["text", "source"]
-        )
-        
-        retrieved_texts = []
-        for res in results[0]:
-            retrieved_texts.append(f"[Source: {os.path.basename(res['entity']['source'])}]\n{res['entity']['text']}")
-            
-        return "\n\n".join(retrieved_texts)
+        return format_context(self.retrieve_chunks(query, top_k))
 
 if __name__ == "__main__":
     # Test run
@@ -0,0 +1,122 @@
+import numpy as np
+
+# Labelled example queries per intent. Tool intents name the exact tool
+# action so agents do not need to re-parse the query.
+INTENT_EXEMPLARS = {
+    "knowledge_base": [
+        "What is the overdraft fee?",
+        "How much does an international wire transfer cost?",
+        "What are the monthly maintenance fees for checking?",
+        "What documents do I need to open an account?",
+        "What ID is required for KYC?",
+        "What do I need to open a business account?",
+        "How do I dispute a transaction?",
+        "How long does a dispute investigation take?",
+        "What is your policy on ATM fees?",
+        "Is there a fee for excessive savings withdrawals?",
+    ],
+    "account_balance": [
+        "What is my account balance?",
+        "How much money do I have?",
+        "Check my balance",
+        "How much is in my checking account?",
+        "Show my available funds",
+    ],
+    "account_details": [
+        "Show my account details",
+        "What type of account do I have?",
+        "Is my account active?",
+        "Who is the owner of my account?",
+        "Give me information about my account",
+    ],
+    "account_overview": [
+        "Give me an overview of my account",
+        "Summarize my account",
+        "Show my account summary",
+        "Show my balance, account details and recent transactions together",
+        "What's the full picture of my account?",
+    ],
+    "recent_transactions": [
+        "Show me my recent transactions",
+        "What did I spend money on recently?",
+        "List my last payments",
+        "What payments have I received?",
+        "Show my transaction history",
+    ],
+    "transfer_funds": [
+        "Transfer $100 to my savings",
+        "Send money to another account",
+        "I want to move funds between accounts",
+        "Make a transfer of 500 dollars",
+        "Wire money to account 987654321",
+    ],
+    "block_card": [
+        "Block my card",
+        "I lost my card, please block it",
+        "My card was stolen, freeze it",
+        "Disable my debit card immediately",
+        "Someone is using my card without permission",
+    ],
+    "replace_card": [
+        "I need a replacement card",
+        "Send me a new card",
+        "My card is damaged, can I get another one?",
+        "Order a new debit card",
+        "Replace my lost card",
+    ],
+}
+
+# Intents that move money or change a card; they need a stronger match than lookups
+WRITE_INTENTS = ("transfer_funds", "block_card", "replace_card")
+
+# Agent that handles each intent; None is the knowledge base (RAG chain)
+INTENT_AGENTS = {
+    "knowledge_base": None,
+    "account_balance": "account",
+    "account_details": "account",
+    "account_overview": "account",
+    "recent_transactions": "transaction",
+    "transfer_funds": "transaction",
+    "block_card": "card",
+    "replace_card": "card",
+}
+
+
+class IntentRouter:
+    """Nearest-exemplar intent classifier over sentence embeddings.
+
+    Exemplar embeddings are computed once; classifying a query embedding is
+    a single matrix-vector product plus a per-intent max.
+    """
+
+    def __init__(self, encoder, exemplars=INTENT_EXEMPLARS, min_confidence=0.35, write_confidence=0.55):
+        self.encoder = encoder
+        self.min_confidence = min_confidence
+        self.write_confidence = write_confidence
+        self.intents = list(exemplars)
+        self._thresholds = np.array([write_confidence if intent in WRITE_INTENTS else min_confidence
+                                     for intent in self.intents], dtype=np.float32)
+        texts = [text for intent in self.intents for text in exemplars[intent]]
+        self._vectors = np.asarray(self.encoder.encode(texts, normalize_embeddings=True), dtype=np.float32)
+        # Exemplars are grouped by intent, so each intent is one contiguous slice
+        sizes = [len(exemplars[intent]) for intent in self.intents]
+        self._starts = np.cumsum([0] + sizes[:-1])
+
+    def classify_vector(self, vector):
+        """Return (intent, confidence) for a query embedding.
+
+        Falls back to the knowledge base when the best intent does not reach
+        min_confidence, or write_confidence for one of WRITE_INTENTS.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        scores = self._vectors @ (vector / norm if norm else vector)
+        intent_scores = np.maximum.reduceat(scores, self._starts)
+        best = int(np.argmax(intent_scores))
+        confidence = float(intent_scores[best])
+        if confidence < self._thresholds[best]:
+            return "knowledge_base", confidence
+        return self.intents[best], confidence
+
+    def classify(self, query):
+        return self.classify_vector(self.encoder.encode(query))
@@ -0,0 +1,88 @@
+import os
+import time
+import signal
+import socket
+import traceback
+import uvicorn
+
+# A worker that dies sooner than this after starting is respawned only after
+# a pause, so a crash at boot does not turn into a fork loop
+RESPAWN_BACKOFF = 1.0
+
+
+def serve_prefork(app, host="0.0.0.0", port=8000, workers=2, on_worker_start=None, on_worker_exit=None):
+    """Run ``app`` in ``workers`` forked uvicorn processes sharing one listening socket.
+
+    Anything loaded before this call (e.g. model weights) is shared with the
+    workers copy-on-write. ``on_worker_start(index)`` runs in each child right
+    after the fork, before it starts serving; ``on_worker_exit(index)`` runs
+    when it stops, since children leave with ``os._exit`` and skip atexit
+    handlers. A worker that dies is replaced until the server is stopped.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    def spawn(index):
+        pid = os.fork()
+        if pid:
+            return pid
+        # The parent's handlers below would stop the other workers; uvicorn installs its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        exit_code = 0
+        try:
+            if on_worker_start:
+                on_worker_start(index)
+            config = uvicorn.Config(app, host=host, port=port)
+            uvicorn.Server(config).run(sockets=[sock])
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            try:
+                if on_worker_exit:
+                    on_worker_exit(index)
+            finally:
+                os._exit(exit_code)
+
+    # pid -> (worker index, start time)
+    children = {}
+    for index in range(workers):
+        children[spawn(index)] = (index, time.monotonic())
+    print(f"[Server] Started {workers} workers on {host}:{port} (pids {', '.join(map(str, children))})")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            if pid not in children:
+                continue
+            index, started = children.pop(pid)
+            if stopping:
+                continue
+            print(f"[Server] Worker {index} (pid {pid}) exited with code {os.waitstatus_to_exitcode(status)}; "
+                  f"restarting it")
+            if time.monotonic() - started < RESPAWN_BACKOFF:
+                time.sleep(RESPAWN_BACKOFF)
+            if not stopping:
+                children[spawn(index)] = (index, time.monotonic())
+    finally:
+        sock.close()
@@ -0,0 +1,152 @@
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+def echo_reply(prompt, reply_words):
+    """Deterministic reply that echoes the prompt, so replies vary with the input"""
+    words = prompt.split()
+    return " ".join(words[i % len(words)] for i in range(reply_words)) if words else "OK"
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic local chat model for load tests and benchmarks.
+
+    Waits ``latency`` seconds before the first token, then emits tokens at
+    ``tokens_per_sec`` (0 means the whole reply arrives at once).
+    """
+
+    latency: float = 0.5
+    tokens_per_sec: float = 0.0
+    reply_words: int = 40
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _reply(self, messages):
+        return echo_reply(" ".join(str(m.content) for m in messages), self.reply_words)
+
+    def _tokens(self, text):
+        return re.findall(r"\S+\s*", text)
+
+    def _generation_time(self, text):
+        if self.tokens_per_sec <= 0:
+            return self.latency
+        return self.latency + len(self._tokens(text)) / self.tokens_per_sec
+
+    def _usage(self, messages, text):
+        """Token usage in the shape real chat models report it (words stand in for tokens)"""
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(self._tokens(text))
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _result(self, messages, text):
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        time.sleep(self._generation_time(text))
+        return self._result(messages, text)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        await asyncio.sleep(self._generation_time(text))
+        return self._result(messages, text)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        time.sleep(self.latency)
+        for token in self._tokens(text):
+            if self.tokens_per_sec > 0:
+                time.sleep(1 / self.tokens_per_sec)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        # Usage arrives on a final empty chunk, as with OpenAI's stream_usage
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(text):
+            if self.tokens_per_sec > 0:
+                await asyncio.sleep(1 / self.tokens_per_sec)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+
+def create_stub_openai_app(latency=0.2, slow_rate=0.0, slow_latency=5.0, failure_rate=0.0,
+                           failure_status=503, reply_words=40, seed=None):
+    """OpenAI-compatible /v1/chat/completions server for exercising the LLM transport.
+
+    Each request waits ``latency`` seconds, or ``slow_latency`` for a
+    ``slow_rate`` fraction of requests, and a ``failure_rate`` fraction fail
+    with ``failure_status``. Point the assistant at it with
+    OPENAI_BASE_URL=http://host:port/v1.
+    """
+    app = FastAPI(title="Stub OpenAI API")
+    rng = random.Random(seed)
+    app.state.stats = {"requests": 0, "failures": 0, "slow": 0}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+        if rng.random() < failure_rate:
+            stats["failures"] += 1
+            return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}},
+                                status_code=failure_status)
+        slow = rng.random() < slow_rate
+        stats["slow"] += slow
+        await asyncio.sleep(slow_latency if slow else latency)
+
+        prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        text = echo_reply(prompt, reply_words)
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": reply_words,
+                 "total_tokens": len(prompt.split()) + reply_words}
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+        if not body.get("stream"):
+            return JSONResponse({**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]})
+
+        async def events():
+            for token in re.findall(r"\S+\s*", text):
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible server with injected latency and failures")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--failure-status", type=int, default=503)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_openai_app(args.latency, args.slow_rate, args.slow_latency,
+                                       args.failure_rate, args.failure_status),
+                host="127.0.0.1", port=args.port)
@@ -1,30 +1,279 @@
-class AccountTool:
-    def get_balance(self, account_id):
+import os
+import random
+import asyncio
+import threading
+import weakref
+from collections import Counter
+from datetime import date
+from cache import TTLCache
+
+# Seconds a cached lookup stays fresh. Balances and transactions change with
+# every payment, so they only absorb bursts; account details rarely change.
+DEFAULT_TOOL_TTLS = {"balance": 5.0, "transactions": 15.0, "details": 300.0}
+
+# (pid, loop) of the background event loop behind run_sync
+_sync_loop = (None, None)
+_sync_loop_lock = threading.Lock()
+
+def run_sync(coro):
+    """Run a tool coroutine from synchronous code and return its result.
+
+    Coroutines run on one background event loop shared by all sync callers,
+    so this works from threads that are already running an event loop, and
+    concurrent lookups from different threads still coalesce. Context
+    variables such as the request trace carry over to the coroutine.
+    """
+    global _sync_loop
+    with _sync_loop_lock:
+        pid, loop = _sync_loop
+        # A forked worker does not inherit the loop's thread
+        if pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="tool-loop", daemon=True).start()
+            _sync_loop = (os.getpid(), loop)
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+class MockBankingBackend:
+    """In-memory stand-in for the core banking APIs.
+
+    Every call sleeps ``latency`` seconds plus up to ``jitter`` seconds, like a
+    remote call would, and is counted in ``calls``. Transfers and card actions
+    change the stored data, so stale cache entries are visible.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+        self._accounts = {}
+        self._card_accounts = {"4321": "123456789"}
+        self._next_transaction = 998877
+        # Calls from different event loops (e.g. sync route_query threads) touch the same data
+        self._lock = threading.Lock()
+
+    async def _call(self, name):
+        self.calls[name] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _account(self, account_id):
+        if account_id not in self._accounts:
+            self._accounts[account_id] = {
+                "balance": 5432.10,
+                "type": "Checking",
+                "status": "Active",
+                "owner": "John Doe",
+                "transactions": [
+                    {"date": "2023-10-25", "description": "Grocery Store", "amount": -150.00},
+                    {"date": "2023-10-24", "description": "Paycheck", "amount": 2500.00},
+                    {"date": "2023-10-22", "description": "Electric Bill", "amount": -120.50}
+                ],
+                "cards": {last4: "Active" for last4, owner in self._card_accounts.items() if owner == account_id},
+            }
+        return self._accounts[account_id]
+
+    async def get_balance(self, account_id):
         print(f"[Mock API] Fetching balance for {account_id}")
-        return {"account_id": account_id, "balance": 5432.10, "currency": "USD"}
+        await self._call("get_balance")
+        with self._lock:
+            account = self._account(account_id)
+            return {"account_id": account_id, "balance": round(account["balance"], 2), "currency": "USD"}
 
-    def get_details(self, account_id):
+    async def get_details(self, account_id):
         print(f"[Mock API] Fetching details for {account_id}")
-        return {"account_id": account_id, "type": "Checking", "status": "Active", "owner": "John Doe"}
+        await self._call("get_details")
+        with self._lock:
+            account = self._account(account_id)
+            return {"account_id": account_id, "type": account["type"], "status": account["status"],
+                    "owner": account["owner"],
+                    "cards": [{"last4": last4, "status": status} for last4, status in account["cards"].items()]}
 
-class TransactionTool:
-    def get_recent_transactions(self, account_id, limit=5):
+    async def get_recent_transactions(self, account_id, limit=5):
         print(f"[Mock API] Fetching last {limit} transactions for {account_id}")
-        return [
-            {"date": "2023-10-25", "description": "Grocery Store", "amount": -150.00},
-            {"date": "2023-10-24", "description": "Paycheck", "amount": 2500.00},
-            {"date": "2023-10-22", "description": "Electric Bill", "amount": -120.50}
-        ]
+        await self._call("get_recent_transactions")
+        with self._lock:
+            return [dict(t) for t in self._account(account_id)["transactions"][:limit]]
 
-    def transfer_funds(self, source_account, target_account, amount):
+    async def transfer_funds(self, source_account, target_account, amount):
         print(f"[Mock API] Transferring ${amount} from {source_account} to {target_account}")
-        return {"status": "success", "transaction_id": "TXN998877"}
+        await self._call("transfer_funds")
+        today = date.today().isoformat()
+        with self._lock:
+            for account_id, signed, description in ((source_account, -amount, f"Transfer to {target_account}"),
+                                                     (target_account, amount, f"Transfer from {source_account}")):
+                account = self._account(account_id)
+                account["balance"] += signed
+                account["transactions"].insert(0, {"date": today, "description": description, "amount": signed})
+            transaction_id = f"TXN{self._next_transaction}"
+            self._next_transaction += 1
+        return {"status": "success", "transaction_id": transaction_id}
 
-class CardTool:
-    def block_card(self, card_last4, reason="lost"):
+    def _set_card_status(self, card_last4, status):
+        """Account holding the card, or None for a card this backend does not know"""
+        with self._lock:
+            account_id = self._card_accounts.get(card_last4)
+            if account_id is not None:
+                self._account(account_id)["cards"][card_last4] = status
+            return account_id
+
+    async def block_card(self, card_last4, reason="lost"):
         print(f"[Mock API] Blocking card ending in {card_last4}. Reason: {reason}")
-        return {"status": "success", "message": f"Card *{card_last4} has been blocked."}
+        await self._call("block_card")
+        account_id = self._set_card_status(card_last4, "Blocked")
+        return {"status": "success", "message": f"Card *{card_last4} has been blocked.", "account_id": account_id}
 
-    def request_replacement(self, card_last4):
+    async def request_replacement(self, card_last4):
         print(f"[Mock API] Requesting replacement for card ending in {card_last4}")
-        return {"status": "success", "message": "Replacement card shipped. ETA 3-5 business days."}
+        await self._call("request_replacement")
+        account_id = self._set_card_status(card_last4, "Replacement Ordered")
+        return {"status": "success", "message": "Replacement card shipped. ETA 3-5 business days.",
+                "account_id": account_id}
+
+class ToolCache:
+    """Per-account read-through cache for core banking lookups.
+
+    Each field (balance, transactions, details) has its own TTL and holds up
+    to ``maxsize`` accounts. Concurrent lookups of the same key share one
+    backend call, and ``invalidate`` after a write drops the account's
+    entries and keeps lookups already in flight from caching what they read.
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, ttls=None, maxsize=10000):
+        self.ttls = {**DEFAULT_TOOL_TTLS, **(ttls or {})}
+        # field -> account_id -> {lookup args: value}; an account's entry expires as a whole
+        self._caches = {field: TTLCache(maxsize=maxsize, ttl=ttl) for field, ttl in self.ttls.items()}
+        # (field, account_id) -> tickets of backend calls in flight, which invalidate marks stale
+        self._running = {}
+        # Guards the entries, tickets and stats: lookups may run on several event loops and threads
+        self._lock = threading.Lock()
+        # In-flight backend calls per event loop, since futures belong to one loop
+        self._flights = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def get(self, field, account_id, args, fetch):
+        """Cached value of ``field`` for an account and lookup args, else the result of awaiting ``fetch()``"""
+        loop = asyncio.get_running_loop()
+        flight_key = (field, account_id, args)
+        with self._lock:
+            entry = self._caches[field].get(account_id)
+            if entry is not None and args in entry:
+                self.hits += 1
+                return entry[args]
+            flights = self._flights.setdefault(loop, {})
+            flight = flights.get(flight_key)
+            if flight is not None and not flight[0]["stale"]:
+                self.coalesced += 1
+                task = flight[1]
+            else:
+                self.misses += 1
+                ticket = {"stale": False}
+                self._running.setdefault((field, account_id), []).append(ticket)
+                task = loop.create_task(self._fetch(field, account_id, args, ticket, fetch))
+                flights[flight_key] = (ticket, task)
+                task.add_done_callback(lambda _: self._finish(flights, flight_key, ticket))
+        # One caller giving up must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def _fetch(self, field, account_id, args, ticket, fetch):
+        value = await fetch()
+        with self._lock:
+            # Invalidated while in flight: the value may predate the write, so hand it out but do not keep it
+            if not ticket["stale"]:
+                entry = self._caches[field].get(account_id)
+                if entry is None:
+                    self._caches[field].set(account_id, {args: value})
+                else:
+                    entry[args] = value
+        return value
+
+    def _finish(self, flights, flight_key, ticket):
+        field, account_id, _ = flight_key
+        with self._lock:
+            tickets = self._running[(field, account_id)]
+            tickets.remove(ticket)
+            if not tickets:
+                del self._running[(field, account_id)]
+            if flights.get(flight_key, (None,))[0] is ticket:
+                del flights[flight_key]
+
+    def invalidate(self, account_id, fields=None):
+        with self._lock:
+            for field in fields or self.ttls:
+                self._caches[field].pop(account_id)
+                for ticket in self._running.get((field, account_id), ()):
+                    ticket["stale"] = True
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for cache in self._caches.values():
+                cache.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                "size": sum(len(cache) for cache in self._caches.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.coalesced) / total, 3) if total else 0.0,
+            }
+
+class BankingTool:
+    """Async banking tool on a backend, with reads going through a shared ToolCache"""
+
+    def __init__(self, backend=None, cache=None):
+        self.backend = backend if backend is not None else MockBankingBackend()
+        self.cache = cache if cache is not None else ToolCache()
+
+    def _read(self, field, account_id, fetch, *args):
+        return self.cache.get(field, account_id, args, lambda: fetch(account_id, *args))
+
+class AccountTool(BankingTool):
+    async def get_balance(self, account_id):
+        return await self._read("balance", account_id, self.backend.get_balance)
+
+    async def get_details(self, account_id):
+        return await self._read("details", account_id, self.backend.get_details)
+
+    async def get_overview(self, account_id, limit=5):
+        """Details, balance and recent transactions, fetched concurrently"""
+        details, balance, transactions = await asyncio.gather(
+            self.get_details(account_id),
+            self.get_balance(account_id),
+            self._read("transactions", account_id, self.backend.get_recent_transactions, limit),
+        )
+        return {**details, "balance": balance["balance"], "currency": balance["currency"],
+                "recent_transactions": transactions}
+
+class TransactionTool(BankingTool):
+    async def get_recent_transactions(self, account_id, limit=5):
+        return await self._read("transactions", account_id, self.backend.get_recent_transactions, limit)
+
+    async def transfer_funds(self, source_account, target_account, amount):
+        try:
+            return await self.backend.transfer_funds(source_account, target_account, amount)
+        finally:
+            # Also after a failure or timeout: the transfer may still have gone through
+            for account_id in (source_account, target_account):
+                self.cache.invalidate(account_id, ["balance", "transactions"])
+
+class CardTool(BankingTool):
+    async def block_card(self, card_last4, reason="lost"):
+        result = await self.backend.block_card(card_last4, reason)
+        if result.get("account_id"):
+            self.cache.invalidate(result["account_id"], ["details"])
+        return result
+
+    async def request_replacement(self, card_last4):
+        result = await self.backend.request_replacement(card_last4)
+        if result.get("account_id"):
+            self.cache.invalidate(result["account_id"], ["details"])
+        return result